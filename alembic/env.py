@@ -13,6 +13,7 @@ from app.config import get_config
 from app.services.database import Base
 from app.sqlalchemy_models import (
     components_sql,
+    document_images_sql,
     documents_sql,
     setting_types_sql,
     settings_sql,
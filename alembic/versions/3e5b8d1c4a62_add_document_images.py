@@ -0,0 +1,52 @@
+"""Add document images
+
+Revision ID: 3e5b8d1c4a62
+Revises: a7c3e19b2f40
+Create Date: 2026-10-17 15:31:08.512930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utc
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3e5b8d1c4a62"
+down_revision: Union[str, None] = "a7c3e19b2f40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "document_images",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("file_name", sa.String(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("uuid", sa.String(), nullable=True),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column(
+            "created_at",
+            sqlalchemy_utc.sqltypes.UtcDateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sqlalchemy_utc.sqltypes.UtcDateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("created_by", sa.Integer(), nullable=False),
+        sa.Column("updated_by", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("sha256"),
+        sa.UniqueConstraint("uuid"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("document_images")
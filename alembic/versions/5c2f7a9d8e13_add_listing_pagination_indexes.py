@@ -0,0 +1,32 @@
+"""Add listing pagination indexes
+
+Revision ID: 5c2f7a9d8e13
+Revises: 3e5b8d1c4a62
+Create Date: 2026-10-17 16:02:37.114508
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5c2f7a9d8e13"
+down_revision: Union[str, None] = "3e5b8d1c4a62"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_full_name_id", "users", ["full_name", "id"])
+    op.create_index("ix_projects_title_id", "projects", ["title", "id"])
+    op.create_index("ix_settings_title_id", "settings", ["title", "id"])
+    op.create_index("ix_setting_types_title_id", "setting_types", ["title", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_setting_types_title_id", table_name="setting_types")
+    op.drop_index("ix_settings_title_id", table_name="settings")
+    op.drop_index("ix_projects_title_id", table_name="projects")
+    op.drop_index("ix_users_full_name_id", table_name="users")
@@ -0,0 +1,26 @@
+"""Rename document image ref_count to upload_count
+
+Revision ID: 8d4e6b2a9f71
+Revises: 5c2f7a9d8e13
+Create Date: 2026-10-17 17:24:51.730962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d4e6b2a9f71"
+down_revision: Union[str, None] = "5c2f7a9d8e13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column("document_images", "ref_count", new_column_name="upload_count")
+
+
+def downgrade() -> None:
+    op.alter_column("document_images", "upload_count", new_column_name="ref_count")
@@ -0,0 +1,49 @@
+"""Add materialized path to components
+
+Revision ID: a7c3e19b2f40
+Revises: 
+Create Date: 2026-10-17 09:12:44.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c3e19b2f40"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "components",
+        sa.Column("path", sa.String(collation="C"), nullable=True),
+    )
+    op.execute(
+        """
+        WITH RECURSIVE tree AS (
+            SELECT id, '/' || id || '/' AS path
+            FROM components
+            WHERE parent_id IS NULL
+            UNION ALL
+            SELECT components.id, tree.path || components.id || '/'
+            FROM components
+            JOIN tree ON components.parent_id = tree.id
+        )
+        UPDATE components
+        SET path = tree.path
+        FROM tree
+        WHERE components.id = tree.id
+        """
+    )
+    op.alter_column("components", "path", nullable=False)
+    op.create_index("ix_components_path", "components", ["path"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_components_path", table_name="components")
+    op.drop_column("components", "path")
@@ -0,0 +1,30 @@
+"""Add component project state index
+
+Revision ID: c4e9a2d7b815
+Revises: 8d4e6b2a9f71
+Create Date: 2026-10-17 18:41:09.527316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e9a2d7b815"
+down_revision: Union[str, None] = "8d4e6b2a9f71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_components_project_id_updated_at",
+        "components",
+        ["project_id", "updated_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_components_project_id_updated_at", table_name="components")
@@ -1,3 +1,4 @@
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import Depends, FastAPI, Header, HTTPException, Request
@@ -10,6 +11,15 @@ from typing_extensions import Annotated
 
 from app.config import config_manager, get_config
 from app.services.database import sessionmanager
+from app.services.auth_cache import principal_cache, token_cache
+from app.services.component_cache import component_cache
+from app.services.create_docx import load_template
+from app.services.export_cache import export_cache, fragment_cache
+from app.services.export_executor import export_executor, image_executor
+from app.services.export_jobs import export_jobs
+from app.services.passwords import login_throttle, password_service
+from app.services.uploads import RequestBodyLimit
+from app.services.utils import error_print
 
 
 async def verify_auth(authorization: Annotated[str, Header()]):
@@ -29,10 +39,62 @@ def init_app(config_file: str = "config.json"):
     api_prefix = "/api/" + config["api_version"]
 
     sessionmanager.init(config["db_url"], config["config_name"])
+    # Fails startup on a broken template instead of every docx export
+    load_template()
+    export_jobs.init(max_history=config.get("export_job_history") or 100)
+    export_cache.init(
+        os.path.join(os.getcwd(), "app", "static"),
+        max_bytes=config.get("export_cache_max_bytes", 500 * 1024 * 1024),
+    )
+    fragment_cache.init(
+        max_bytes=config.get("export_fragment_cache_max_bytes", 100 * 1024 * 1024)
+    )
+    component_cache.init(
+        max_bytes=config.get("component_cache_max_bytes", 50 * 1024 * 1024)
+    )
+    principal_cache.init(ttl=config.get("principal_cache_ttl_seconds", 30))
+    token_cache.init(max_entries=config.get("token_cache_max_entries", 10000))
+    password_service.init(
+        max_workers=config.get("password_workers") or 2,
+        max_queued=config.get("password_max_queued") or 100,
+    )
+    login_throttle.init(
+        max_attempts=config.get("login_max_attempts", 10),
+        window=config.get("login_window_seconds", 60),
+        max_address_attempts=config.get("login_max_address_attempts", 100),
+    )
 
     @asynccontextmanager
     async def lifespan(app: FastAPI):
+        # The worker processes live as long as the server, see the shutdown below
+        export_executor.init(
+            max_workers=config.get("export_workers") or 2,
+            max_concurrency=config.get("export_max_concurrency"),
+            max_queued=config.get("export_max_queued") or 50,
+            initializer=load_template,
+        )
+        image_executor.init(
+            max_workers=config.get("image_workers") or 1,
+            max_queued=config.get("image_max_queued") or 50,
+            name="image uploads",
+        )
+        if not config["enforce_authentication"]:
+            from app.views.auth_view import get_default_principal
+
+            try:
+                await get_default_principal()
+            except Exception as error:
+                # The default user is not created yet or the database is not
+                # reachable yet, it is resolved on first use
+                error_print(__name__, "lifespan", error)
         yield
+        await export_jobs.close()
+        if export_executor.init_done():
+            export_executor.close()
+        if image_executor.init_done():
+            image_executor.close()
+        if password_service.init_done():
+            password_service.close()
         if sessionmanager._engine is not None:
             await sessionmanager.close()
 
@@ -68,12 +130,17 @@ def init_app(config_file: str = "config.json"):
         response = await call_next(request)
         return response
 
+    server.add_middleware(
+        RequestBodyLimit,
+        max_bytes=config.get("upload_max_request_bytes") or 100 * 1024 * 1024,
+    )
     server.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor"],
     )
 
     # from app.views.projects import router as project_router
@@ -133,6 +200,10 @@ def init_app(config_file: str = "config.json"):
 
     server.include_router(document_router, prefix=api_prefix, tags=["documents"])
 
+    from app.views.exports_view import router as export_router
+
+    server.include_router(export_router, prefix=api_prefix, tags=["exports"])
+
     from app.views.websocket import router as websocket_router
 
     server.include_router(websocket_router, prefix=api_prefix, tags=["doc_export"])
@@ -1 +1 @@
-from .h2d import HtmlToDocx
+from .h2d import HtmlToDocx, ImageResolver
@@ -18,18 +18,26 @@ import io
 import os
 import re
 import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from html.parser import HTMLParser
 from urllib.parse import urlparse
 
 import docx
 import docx.table
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
 from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_COLOR
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.shared import Inches, Pt, RGBColor
 
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
 # values in inches
 INDENT = 0.25
 LIST_INDENT = 0.5
@@ -41,6 +49,9 @@ DEFAULT_TABLE_STYLE = None
 # Style to use with paragraphs. By default no style is used.
 DEFAULT_PARAGRAPH_STYLE = None
 
+# Bytes of images an ImageResolver keeps in memory.
+DEFAULT_IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+
 
 def get_filename_from_url(url):
     return os.path.basename(urlparse(url).path)
@@ -55,7 +66,7 @@ def is_url(url):
     return all([parts.scheme, parts.netloc, parts.path])
 
 
-def fetch_image(url):
+def fetch_image(url, timeout=None):
     """
     Attempts to fetch an image from a url.
     If successful returns a bytes object, else returns None
@@ -63,13 +74,118 @@ def fetch_image(url):
     :return:
     """
     try:
-        with urllib.request.urlopen(url) as response:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
             # security flaw?
             return io.BytesIO(response.read())
-    except urllib.error.URLError:
+    except (urllib.error.URLError, TimeoutError):
         return None
 
 
+class ImageResolver:
+    """
+    Turns the src of an img tag into something python-docx can embed.
+
+    Urls below one of static_paths are mapped to the local directory they are
+    served from, without a http round trip. Remote images are fetched
+    concurrently with prefetch before parsing starts. Image bytes are kept in
+    an LRU of at most max_bytes, so an image used several times, or in several
+    documents parsed with the same resolver, is only read once.
+
+    Subclass and override local_path to map urls to files differently.
+    """
+
+    def __init__(self, static_paths=None, timeout=10, max_workers=8, max_bytes=None):
+        self.static_paths = static_paths or {}
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.max_bytes = DEFAULT_IMAGE_CACHE_BYTES if max_bytes is None else max_bytes
+        self._images = OrderedDict()
+        self._size = 0
+        self._missing = set()
+
+    def local_path(self, src):
+        """
+        Returns the local file for src, or None if src is a remote url
+
+        Raises a ValueError when src is below a static path but its file is
+        not in the directory of that path, e.g. through ".." segments
+        """
+        path = urlparse(src).path
+        for prefix, directory in self.static_paths.items():
+            if path.startswith(prefix):
+                local_path = os.path.normpath(
+                    os.path.join(directory, path[len(prefix) :])
+                )
+                root = os.path.realpath(directory)
+                if os.path.commonpath([root, os.path.realpath(local_path)]) != root:
+                    raise ValueError("Image %s is outside of %s" % (src, prefix))
+                return local_path
+        return None if is_url(src) else src
+
+    def is_remote(self, src):
+        try:
+            return self.local_path(src) is None
+        except ValueError:
+            return False
+
+    def prefetch(self, sources):
+        """
+        Fetches the remote images among sources concurrently
+        """
+        # Images that could not be fetched are not tried again until the next
+        # prefetch
+        self._missing = set()
+        urls = [
+            src
+            for src in set(sources)
+            if src not in self._images and self.is_remote(src)
+        ]
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            images = pool.map(lambda url: fetch_image(url, self.timeout), urls)
+            for url, image in zip(urls, images):
+                if image is not None:
+                    self._store(url, image.getvalue())
+                else:
+                    self._missing.add(url)
+
+    def resolve(self, src):
+        """
+        Returns a file like object with the image for src, or None if there is
+        no such image
+        """
+        if src in self._images:
+            self._images.move_to_end(src)
+            return io.BytesIO(self._images[src])
+        if src in self._missing:
+            return None
+        try:
+            path = self.local_path(src)
+        except ValueError:
+            return None
+        if path is None:
+            image = fetch_image(src, self.timeout)
+            if image is None:
+                return None
+            self._store(src, image.getvalue())
+            return image
+        try:
+            with open(path, "rb") as image_file:
+                image = image_file.read()
+        except OSError:
+            return None
+        self._store(src, image)
+        return io.BytesIO(image)
+
+    def _store(self, src, image):
+        self._images[src] = image
+        self._size += len(image)
+        while self._size > self.max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self._size -= len(evicted)
+
+
 def remove_last_occurence(ls, x):
     ls.pop(len(ls) - ls[::-1].index(x) - 1)
 
@@ -140,6 +256,15 @@ def remove_whitespace(string, leading=False, trailing=False):
     return re.sub(r"\s+", " ", string)
 
 
+def is_markup(text):
+    """
+    Whether text would change when it is parsed as html again. get_cell_html
+    writes the text of a cell unescaped, so the child parser reads entities
+    and tags from it
+    """
+    return "&" in text or "<" in text
+
+
 def delete_paragraph(paragraph):
     # https://github.com/python-openxml/python-docx/issues/33#issuecomment-77661907
     p = paragraph._element
@@ -164,6 +289,10 @@ font_names = {
     "pre": "Courier",
 }
 
+# Tags a table cell may contain and still be written directly by
+# HtmlToDocx.write_simple_cell, when they have no attributes
+simple_cell_tags = {"b", "strong", "em", "i", "u", "s", "sup", "sub", "code", "p"}
+
 styles = {
     "LIST_BULLET": "List Bullet",
     "LIST_NUMBER": "List Number",
@@ -179,6 +308,9 @@ class HtmlToDocx(HTMLParser):
             "images": True,
             "tables": True,
             "styles": True,
+            # "lxml" walks a single lxml tree, "html.parser" cleans the html
+            # with BeautifulSoup and feeds it to HTMLParser
+            "engine": "lxml" if etree else "html.parser",
         }
         self.table_row_selectors = [
             "table > tr",
@@ -188,6 +320,10 @@ class HtmlToDocx(HTMLParser):
         ]
         self.table_style = DEFAULT_TABLE_STYLE
         self.paragraph_style = DEFAULT_PARAGRAPH_STYLE
+        self.image_resolver = ImageResolver()
+        # style ids by (name, type) of the document the styles_part belongs to
+        self.styles_part = None
+        self.style_ids = {}
 
     def set_initial_attrs(self, document=None):
         self.tags = {
@@ -220,6 +356,10 @@ class HtmlToDocx(HTMLParser):
         """Copy settings from another instance of HtmlToDocx"""
         self.table_style = other.table_style
         self.paragraph_style = other.paragraph_style
+        self.image_resolver = other.image_resolver
+        self.options["engine"] = other.options["engine"]
+        self.styles_part = other.styles_part
+        self.style_ids = other.style_ids
 
     def get_cell_html(self, soup):
         # Returns string of td element with opening and closing <td> tags removed
@@ -279,12 +419,55 @@ class HtmlToDocx(HTMLParser):
                 # For now set color to black to prevent crashing
             self.run.font.highlight_color = WD_COLOR.GRAY_25  # TODO: map colors
 
+    def set_style_ids(self, document, style_ids):
+        """
+        Use style ids resolved in advance for document, e.g. those of the
+        template it was copied from
+        """
+        self.styles_part = document.part
+        self.style_ids = dict(style_ids)
+
+    def get_style_id(self, style, style_type):
+        """
+        Returns the id of a style, given by name or style object, in the
+        document being written. python-docx looks styles up by scanning the
+        styles part, so the ids are kept per document
+        """
+        part = self.doc.part
+        if part is not self.styles_part:
+            self.set_style_ids(self.doc, {})
+        key = (getattr(style, "name", style), style_type)
+        if key not in self.style_ids:
+            self.style_ids[key] = part.get_style_id(
+                self.find_style(part, style), style_type
+            )
+        return self.style_ids[key]
+
+    def find_style(self, part, style):
+        """
+        Returns the style object for a style name. A style id, like TableGrid,
+        is accepted as well, python-docx only warns about looking those up
+        """
+        if not isinstance(style, str):
+            return style
+        styles = part.styles
+        if style in styles:
+            return styles[style]
+        for candidate in styles:
+            if candidate.style_id == style:
+                return candidate
+        raise KeyError(f"no style with name '{style}'")
+
     def apply_paragraph_style(self, style=None):
         try:
             if style:
-                self.paragraph.style = style
+                self.paragraph._p.style = self.get_style_id(
+                    style, WD_STYLE_TYPE.PARAGRAPH
+                )
             elif self.paragraph_style:
-                self.paragraph.style = self.paragraph_style
+                self.paragraph._p.style = self.get_style_id(
+                    self.paragraph_style, WD_STYLE_TYPE.PARAGRAPH
+                )
         except KeyError as e:
             raise ValueError(f"Unable to apply style {self.paragraph_style}.") from e
 
@@ -306,7 +489,10 @@ class HtmlToDocx(HTMLParser):
         else:
             list_style = styles["LIST_BULLET"]
 
-        self.paragraph = self.doc.add_paragraph(style=list_style)
+        self.paragraph = self.doc.add_paragraph()
+        self.paragraph._p.style = self.get_style_id(
+            list_style, WD_STYLE_TYPE.PARAGRAPH
+        )
         self.paragraph.paragraph_format.left_indent = Inches(
             min(list_depth * LIST_INDENT, MAX_INDENT)
         )
@@ -324,24 +510,14 @@ class HtmlToDocx(HTMLParser):
             self.skip_tag = "img"
             return
         src = current_attrs["src"]
-        # fetch image
         src_is_url = is_url(src)
-        if src_is_url:
-            try:
-                image = fetch_image(src)
-            except urllib.error.URLError:
-                image = None
-        else:
-            image = src
+        image = self.image_resolver.resolve(src)
         # add image to doc
         if image:
-            try:
-                if isinstance(self.doc, docx.document.Document):
-                    self.doc.add_picture(image, width=Inches(6.25))
-                else:
-                    self.add_image_to_cell(self.doc, image)
-            except FileNotFoundError:
-                image = None
+            if isinstance(self.doc, docx.document.Document):
+                self.doc.add_picture(image, width=Inches(6.25))
+            else:
+                self.add_image_to_cell(self.doc, image)
         if not image:
             if src_is_url:
                 self.doc.add_paragraph("<image: %s>" % src)
@@ -364,23 +540,28 @@ class HtmlToDocx(HTMLParser):
 
         if self.table_style:
             try:
-                self.table.style = self.table_style
+                self.table._tbl.tblStyle_val = self.get_style_id(
+                    self.table_style, WD_STYLE_TYPE.TABLE
+                )
             except KeyError as e:
                 raise ValueError(f"Unable to apply style {self.table_style}.") from e
 
         rows = self.get_table_rows(table_soup)
+        grid = self.get_table_cells(cols)
+        style_id = self.get_paragraph_style_id()
         cell_row = 0
         for row in rows:
             cols = self.get_table_columns(row)
             cell_col = 0
             for col in cols:
-                cell_html = self.get_cell_html(col)
-                if col.name == "th":
-                    cell_html = "<b>%s</b>" % cell_html
-                docx_cell = self.table.cell(cell_row, cell_col)
-                child_parser = HtmlToDocx()
-                child_parser.copy_settings_from(self)
-                child_parser.add_html_to_cell(cell_html, docx_cell)
+                docx_cell = grid[cell_row][cell_col]
+                events = self.get_simple_soup_cell_events(
+                    col, ("b",) if col.name == "th" else ()
+                )
+                if events is not None:
+                    self.write_simple_cell(docx_cell, events, style_id)
+                else:
+                    self.add_soup_to_cell(col, docx_cell)
                 cell_col += 1
             cell_row += 1
 
@@ -390,6 +571,163 @@ class HtmlToDocx(HTMLParser):
         self.skip = True
         self.table = None
 
+    def add_soup_to_cell(self, soup, cell):
+        """
+        Fills cell from its soup with a child parser, which parses the html of
+        the cell again with the html.parser engine
+        """
+        cell_html = self.get_cell_html(soup)
+        if soup.name == "th":
+            cell_html = "<b>%s</b>" % cell_html
+        child_parser = HtmlToDocx()
+        child_parser.copy_settings_from(self)
+        child_parser.options["engine"] = "html.parser"
+        child_parser.add_html_to_cell(cell_html, cell)
+
+    def get_table_cells(self, cols):
+        """
+        Returns the cells of the current table by row. table.cell() rebuilds
+        the whole cell grid on every call, so the grid is fetched once
+        """
+        cells = self.table._cells
+        width = cols or 1
+        return [cells[i : i + width] for i in range(0, len(cells), width)]
+
+    def join_cell_events(self, items, tags):
+        """
+        Returns the events of the children of a cell as the parsed path sees
+        them. get_cell_html joins the children with spaces, so a space ends up
+        between every two of them and joins the text next to it. items holds
+        the children in order, either text or the events of an element, or
+        None for an element that is not simple. Text that get_cell_html would
+        turn into markup is not simple either
+        """
+        events = []
+        text = ""
+        for index, item in enumerate(items):
+            if item is None or isinstance(item, str) and is_markup(item):
+                return None
+            if index:
+                text += " "
+            if isinstance(item, str):
+                text += item
+                continue
+            if text:
+                events.append((text, tags))
+                text = ""
+            events.extend(item)
+        if text:
+            events.append((text, tags))
+        return events
+
+    def get_simple_soup_cell_events(self, soup, tags=()):
+        """
+        Returns the data a cell would be parsed into as (text, tags) pairs, a
+        text of None starts a paragraph. Returns None unless the cell only holds
+        text and simple_cell_tags
+        """
+        items = [
+            str(child)
+            if type(child) is NavigableString
+            else self.get_simple_soup_events(child, tags)
+            for child in soup.children
+        ]
+        return self.join_cell_events(items, tags)
+
+    def get_simple_soup_events(self, element, tags=()):
+        """
+        Returns the events of an element inside a simple cell, or None
+        """
+        if (
+            isinstance(element, NavigableString)
+            or element.name not in simple_cell_tags
+            or element.attrs
+            or element.name in tags
+        ):
+            return None
+        tags = tags + (element.name,)
+        events = [(None, tags[:-1])] if element.name == "p" else []
+        for child in element.children:
+            if type(child) is NavigableString:
+                events.append((str(child), tags))
+                continue
+            child_events = self.get_simple_soup_events(child, tags)
+            if child_events is None:
+                return None
+            events.extend(child_events)
+        return events
+
+    def get_simple_cell_events(self, element, tags=()):
+        """
+        lxml counterpart of get_simple_soup_cell_events
+        """
+        items = [element.text] if element.text else []
+        for child in element:
+            items.append(self.get_simple_element_events(child, tags))
+            if child.tail:
+                items.append(child.tail)
+        return self.join_cell_events(items, tags)
+
+    def get_simple_element_events(self, element, tags=()):
+        """
+        lxml counterpart of get_simple_soup_events
+        """
+        if (
+            element.tag not in simple_cell_tags
+            or element.attrib
+            or element.tag in tags
+        ):
+            return None
+        tags = tags + (element.tag,)
+        events = [(None, tags[:-1])] if element.tag == "p" else []
+        if element.text:
+            events.append((element.text, tags))
+        for child in element:
+            child_events = self.get_simple_element_events(child, tags)
+            if child_events is None:
+                return None
+            events.extend(child_events)
+            if child.tail:
+                events.append((child.tail, tags))
+        return events
+
+    def get_paragraph_style_id(self):
+        """
+        Returns the style id of paragraph_style in the document being written
+        """
+        try:
+            return self.get_style_id(self.paragraph_style, WD_STYLE_TYPE.PARAGRAPH)
+        except KeyError as e:
+            raise ValueError(f"Unable to apply style {self.paragraph_style}.") from e
+
+    def write_simple_cell(self, cell, events, style_id):
+        """
+        Fast path for simple cells, writes the runs a child parser would create
+        for the events directly into the cell
+        """
+        unwanted_paragraph = cell.paragraphs[0]
+        if unwanted_paragraph.text == "":
+            delete_paragraph(unwanted_paragraph)
+        paragraph = None
+        for text, tags in events:
+            if text is None or paragraph is None:
+                paragraph = cell.add_paragraph()
+                if self.paragraph_style:
+                    paragraph._p.style = style_id
+            if text is None:
+                # a <p> starts with an empty run, see handle_starttag
+                paragraph.add_run()
+                continue
+            run = paragraph.add_run(remove_whitespace(text, True, True))
+            for tag in tags:
+                if tag in font_styles:
+                    setattr(run.font, font_styles[tag], True)
+                if tag in font_names:
+                    run.font.name = font_names[tag]
+        # cells must end with a paragraph, see add_html_to_cell
+        if not cell.paragraphs:
+            cell.add_paragraph("")
+
     def handle_link(self, href, text):
         # Link requires a relationship
         is_external = href.startswith("http")
@@ -505,7 +843,10 @@ class HtmlToDocx(HTMLParser):
         elif re.match("h[1-9]", tag):
             if isinstance(self.doc, docx.document.Document):
                 h_size = int(tag[1])
-                self.paragraph = self.doc.add_heading(level=min(h_size, 9))
+                self.paragraph = self.doc.add_paragraph()
+                self.paragraph._p.style = self.get_style_id(
+                    "Heading %d" % min(h_size, 9), WD_STYLE_TYPE.PARAGRAPH
+                )
             else:
                 self.paragraph = self.doc.add_paragraph()
 
@@ -600,6 +941,146 @@ class HtmlToDocx(HTMLParser):
                     font_name = font_names[tag]
                     self.run.font.name = font_name
 
+    def walk_tree(self, element, tail=True):
+        """
+        Emits the start, data and end events of an lxml element and everything
+        below it, tables are converted directly from the tree
+        """
+        tag = element.tag
+        if not isinstance(tag, str):
+            pass  # comments and processing instructions
+        elif tag == "head":
+            pass
+        elif tag == "table" and element.find(".//table") is not None:
+            self.add_table_html(element)
+        elif tag == "table":
+            self.handle_table_element(element)
+        else:
+            self.handle_starttag(tag, element.items())
+            if element.text:
+                self.handle_data(element.text)
+            for child in element:
+                self.walk_tree(child)
+            self.handle_endtag(tag)
+        if tail and element.tail:
+            self.handle_data(element.tail)
+
+    def get_table_row_elements(self, table):
+        # Same rows as table_row_selectors, in document order
+        rows = []
+        for child in table:
+            if child.tag == "tr":
+                rows.append(child)
+            elif child.tag in ("thead", "tbody", "tfoot"):
+                rows.extend(row for row in child if row.tag == "tr")
+        return rows
+
+    def get_table_column_elements(self, row):
+        return [cell for cell in row if cell.tag in ("th", "td")]
+
+    def handle_table_element(self, table):
+        """
+        lxml counterpart of handle_table, the cells are filled by child parsers
+        walking the cell elements
+        """
+        rows = self.get_table_row_elements(table)
+        cols = self.get_table_column_elements(rows[0]) if rows else []
+        self.table = self.doc.add_table(len(rows), len(cols))
+
+        if self.table_style:
+            try:
+                self.table._tbl.tblStyle_val = self.get_style_id(
+                    self.table_style, WD_STYLE_TYPE.TABLE
+                )
+            except KeyError as e:
+                raise ValueError(f"Unable to apply style {self.table_style}.") from e
+
+        grid = self.get_table_cells(len(cols))
+        style_id = self.get_paragraph_style_id()
+        for cell_row, row in enumerate(rows):
+            for cell_col, col in enumerate(self.get_table_column_elements(row)):
+                docx_cell = grid[cell_row][cell_col]
+                events = self.get_simple_cell_events(
+                    col, ("b",) if col.tag == "th" else ()
+                )
+                if events is not None:
+                    self.write_simple_cell(docx_cell, events, style_id)
+                elif any(is_markup(text) for text in self.get_cell_texts(col)):
+                    self.add_soup_to_cell(self.get_element_soup(col), docx_cell)
+                else:
+                    child_parser = HtmlToDocx()
+                    child_parser.copy_settings_from(self)
+                    child_parser.add_element_to_cell(col, docx_cell)
+
+        self.table = None
+        self.doc = self.document
+        self.paragraph = None
+
+    def get_cell_texts(self, element):
+        """
+        The text directly inside a cell element, which get_cell_html would
+        write unescaped
+        """
+        texts = [element.text] if element.text else []
+        texts.extend(child.tail for child in element if child.tail)
+        return texts
+
+    def get_element_soup(self, element):
+        """
+        Returns the soup of an lxml element as the html.parser engine sees it
+        """
+        html = etree.tostring(
+            element, method="html", encoding="unicode", with_tail=False
+        )
+        return BeautifulSoup(html, "html.parser").find(element.tag)
+
+    def add_table_html(self, table):
+        """
+        Converts a table with the html.parser engine. Tables holding tables
+        are converted that way, so that their rows are the same under both
+        engines
+        """
+        html = etree.tostring(table, method="html", encoding="unicode", with_tail=False)
+        parser = HtmlToDocx()
+        parser.copy_settings_from(self)
+        parser.options["engine"] = "html.parser"
+        parser.add_html_to_document(html, self.doc)
+        self.doc = self.document
+        self.paragraph = None
+
+    def add_element_to_cell(self, element, cell):
+        unwanted_paragraph = cell.paragraphs[0]
+        if unwanted_paragraph.text == "":
+            delete_paragraph(unwanted_paragraph)
+        self.set_initial_attrs(cell)
+        if element.tag == "th":
+            self.tags["b"] = {}
+        # The children are joined with spaces like get_cell_html does, a
+        # space joins the text next to it into one data event
+        text = element.text or ""
+        first = not text
+        for child in element:
+            if not first:
+                text += " "
+            first = False
+            if text:
+                self.handle_data(text)
+            self.walk_tree(child, tail=False)
+            text = " " + child.tail if child.tail else ""
+        if text:
+            self.handle_data(text)
+        # cells must end with a paragraph or will get message about corrupt file
+        # https://stackoverflow.com/a/29287121
+        if not self.doc.paragraphs:
+            self.doc.add_paragraph("")
+
+    def run_tree(self, tree):
+        if tree is None:
+            return
+        if self.include_images:
+            self.image_resolver.prefetch(tree.xpath("//img/@src"))
+        self.walk_tree(tree)
+
     def ignore_nested_tables(self, tables_soup):
         """
         Returns array containing only the highest level tables
@@ -644,11 +1125,18 @@ class HtmlToDocx(HTMLParser):
         self.table_no = 0
 
     def run_process(self, html):
+        if self.options["engine"] == "lxml":
+            self.run_tree(etree.HTML(html) if html.strip() else None)
+            return
         if self.bs and BeautifulSoup:
             self.soup = BeautifulSoup(html, "html.parser")
             html = str(self.soup)
         if self.include_tables:
             self.get_tables()
+        if self.include_images and hasattr(self, "soup"):
+            self.image_resolver.prefetch(
+                [img["src"] for img in self.soup.find_all("img", src=True)]
+            )
         self.feed(html)
 
     def add_html_to_document(self, html, document):
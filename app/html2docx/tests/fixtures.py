@@ -0,0 +1,24 @@
+"""
+Html of a component as the exports render it, with text, lists and a
+parameter table, used by the tests and the engine benchmark
+"""
+
+
+def component_html(number):
+    rows = "".join(
+        "<tr><td>Parameter %d</td><td>%d.5</td><td>mm</td>"
+        "<td><p>Source <b>%d</b></p></td><td><i>comment</i></td></tr>" % (i, i, i)
+        for i in range(12)
+    )
+    return (
+        "<h1>Component %d</h1>"
+        "<h2>Description</h2>"
+        '<p style="text-align: justify">Some <b>bold</b>, <i>italic</i> and '
+        '<span style="color: rgb(200, 0, 0)">red</span> text with '
+        '<a href="https://example.com/%d">a link</a>.</p>'
+        "<ul><li>first</li><li>second <u>item</u></li>"
+        "<ol><li>nested</li></ol></ul>"
+        "<table><thead><tr><th>Title</th><th>Value</th><th>Unit</th>"
+        "<th>Source</th><th>Comment</th></tr></thead><tbody>%s</tbody></table>"
+        "<p>Closing remark</p>" % (number, number, rows)
+    )
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import unittest
+import warnings
 from docx import Document
 from .context import HtmlToDocx, test_dir
 
@@ -91,6 +92,14 @@ class OutputTest(unittest.TestCase):
         self.parser.table_style = 'TableGrid'
         self.parser.add_html_to_document(self.table_html, self.document)
 
+    def test_table_style_by_id_does_not_warn(self):
+        document = Document()
+        self.parser.table_style = 'TableGrid'
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.parser.add_html_to_document(self.table_html, document)
+        self.assertEqual(document.tables[0].style.name, 'Table Grid')
+
     def test_add_nested_tables(self):
         self.document.add_heading(
             'Test: add nested tables',
@@ -0,0 +1,112 @@
+import os
+import unittest
+
+from docx import Document
+from .context import HtmlToDocx, test_dir
+
+from .fixtures import component_html
+
+
+def convert(engine, html, fast=True):
+    parser = HtmlToDocx()
+    parser.options['engine'] = engine
+    parser.options['images'] = False
+    parser.paragraph_style = 'Normal'
+    if not fast:
+        parser.get_simple_cell_events = lambda *args: None
+        parser.get_simple_soup_cell_events = lambda *args: None
+    document = Document()
+    parser.add_html_to_document(html, document)
+    return document
+
+
+class EngineTest(unittest.TestCase):
+
+    def test_engines_produce_the_same_document(self):
+        for name in ['text1.html', 'code.html']:
+            with open(os.path.join(test_dir, name)) as f:
+                html = f.read()
+            self.assertEqual(
+                convert('lxml', html).element.body.xml,
+                convert('html.parser', html).element.body.xml,
+            )
+
+    def test_engines_produce_the_same_tables(self):
+        html = component_html(1)
+        self.assertEqual(
+            convert('lxml', html).element.body.xml,
+            convert('html.parser', html).element.body.xml,
+        )
+
+    def test_nested_tables(self):
+        with open(os.path.join(test_dir, 'tables2.html')) as f:
+            document = convert('lxml', f.read())
+        self.assertEqual(len(document.tables), 3)
+        nested = document.tables[1].cell(2, 2).tables[0]
+        self.assertEqual(nested.cell(0, 0).text, 'nr1c1')
+        self.assertEqual(len(nested.cell(1, 1).tables), 1)
+
+    def test_simple_cells_match_parsed_cells(self):
+        html = (
+            '<table><tr><th>H <i>x</i></th><th><b>bold</b> tail</th></tr>'
+            '<tr><td>\n <p>one <code>c</code></p>\n<p>two</p> after</td><td></td></tr>'
+            '<tr><td>a<sup>2</sup>&amp;b</td><td><p><strong>s<em>e</em></strong>t</p></td></tr>'
+            '</table>'
+        )
+        self.assertEqual(
+            convert('lxml', html).element.body.xml,
+            convert('lxml', html, fast=False).element.body.xml,
+        )
+
+    def test_rich_cells_are_parsed(self):
+        html = (
+            '<table><tr><td><b><b>nested</b> same tag</b></td>'
+            '<td><span style="color: #ff0000">red</span></td>'
+            '<td><ul><li>item</li></ul></td></tr></table>'
+        )
+        self.assertEqual(
+            convert('lxml', html).element.body.xml,
+            convert('lxml', html, fast=False).element.body.xml,
+        )
+        cells = convert('lxml', html).tables[0].rows[0].cells
+        self.assertFalse(cells[0].paragraphs[0].runs[1].bold)
+        self.assertIsNotNone(cells[1].paragraphs[0].runs[0].font.color.rgb)
+
+    def assertSameAsParsed(self, html):
+        parsed = convert('html.parser', html, fast=False).element.body.xml
+        for engine in ['lxml', 'html.parser']:
+            for fast in [True, False]:
+                self.assertEqual(
+                    convert(engine, html, fast).element.body.xml, parsed
+                )
+
+    def test_cells_with_paragraphs(self):
+        self.assertSameAsParsed(
+            '<table><tr><td><p>one</p><p>two</p></td>'
+            '<td><p>p</p>tail<p>q</p></td></tr></table>'
+        )
+
+    def test_cells_with_line_breaks(self):
+        html = '<table><tr><td>x<br>y</td><th>h<br>i</th></tr></table>'
+        self.assertSameAsParsed(html)
+        cell = convert('lxml', html).tables[0].cell(0, 0)
+        self.assertEqual(cell.paragraphs[0].text, 'x \n y')
+
+    def test_cells_with_entities(self):
+        self.assertSameAsParsed(
+            '<table><tr><td>a&amp;b</td><td>a<sup>2</sup> &lt;b&gt; c</td>'
+            '<td><b>a&amp;b</b></td></tr></table>'
+        )
+
+    def test_table_files(self):
+        for name in ['tables1.html', 'tables2.html']:
+            with open(os.path.join(test_dir, name)) as f:
+                self.assertSameAsParsed(f.read())
+
+    def test_empty_html(self):
+        document = convert('lxml', '')
+        self.assertEqual(len(document.paragraphs), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
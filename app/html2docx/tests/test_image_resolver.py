@@ -0,0 +1,67 @@
+import os
+import unittest
+from unittest import mock
+
+from docx import Document
+from .context import HtmlToDocx, test_dir
+
+from htmldocx.h2d import ImageResolver
+
+
+class ImageResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image_path = os.path.abspath(os.path.join(test_dir, '..', 'testimg.png'))
+        self.static_dir = os.path.dirname(self.image_path) + os.sep
+        self.resolver = ImageResolver(static_paths={'/static/': self.static_dir})
+
+    def test_static_urls_map_to_local_files(self):
+        for src in ['/static/testimg.png', 'https://example.com/static/testimg.png']:
+            self.assertEqual(self.resolver.local_path(src), self.image_path)
+        self.assertIsNone(self.resolver.local_path('https://example.com/other.png'))
+
+    def test_static_urls_can_not_leave_their_directory(self):
+        outside = '/static/../../../etc/x.png'
+        with self.assertRaises(ValueError):
+            self.resolver.local_path(outside)
+        with mock.patch('builtins.open', wraps=open) as opened:
+            self.assertIsNone(self.resolver.resolve(outside))
+        opened.assert_not_called()
+        self.assertEqual(
+            self.resolver.local_path('/static/sub/../testimg.png'), self.image_path
+        )
+
+    def test_images_are_read_once(self):
+        with mock.patch('builtins.open', wraps=open) as opened:
+            first = self.resolver.resolve('/static/testimg.png').read()
+            second = self.resolver.resolve('/static/testimg.png').read()
+        self.assertEqual(first, second)
+        self.assertEqual(opened.call_count, 1)
+
+    def test_remote_images_are_prefetched(self):
+        urls = ['https://example.com/a.png', 'https://example.com/b.png']
+        with mock.patch('htmldocx.h2d.fetch_image', return_value=None) as fetch:
+            self.resolver.prefetch(urls + urls)
+            self.assertIsNone(self.resolver.resolve(urls[0]))
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_lru_is_bounded(self):
+        resolver = ImageResolver(static_paths={'/static/': self.static_dir}, max_bytes=1)
+        resolver.resolve('/static/testimg.png')
+        resolver.resolve('/static/testimg.png?again')
+        self.assertEqual(list(resolver._images), ['/static/testimg.png?again'])
+
+    def test_parser_embeds_resolved_images(self):
+        parser = HtmlToDocx()
+        parser.image_resolver = self.resolver
+        document = Document()
+        parser.add_html_to_document(
+            '<p>x</p><img src="/static/testimg.png"><img src="/static/missing.png">',
+            document,
+        )
+        self.assertEqual(len(document.inline_shapes), 1)
+        self.assertEqual(document.paragraphs[-1].text, '<image: missing.png>')
+
+
+if __name__ == '__main__':
+    unittest.main()
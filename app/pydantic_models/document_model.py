@@ -212,3 +212,17 @@ class DocumentWithUser(Document):
     updated_by_id: Optional[int] = None
     updated_by_full_name: Optional[str] = None
     updated_by_email: Optional[str] = None
+
+
+class DocumentSummaryWithUser(DocumentBase):
+    """A document without its html and json content, for listings."""
+
+    id: int
+    uuid: str
+    updated_at: Optional[datetime] = None
+    updated_by_id: Optional[int] = None
+    updated_by_full_name: Optional[str] = None
+    updated_by_email: Optional[str] = None
+
+    class Config:
+        from_attributes = True
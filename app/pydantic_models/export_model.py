@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi_camelcase import CamelModel
+
+from app.pydantic_models.project_model import DocResponse
+
+
+class ExportJobResponse(CamelModel):
+    id: str
+    state: str
+    project_id: int
+    document_type: str
+    owner_id: Optional[int] = None
+    total: int
+    completed: int
+    result: Optional[DocResponse] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ExportProgressEvent(CamelModel):
+    type: str = "export_progress"
+    job: ExportJobResponse
@@ -0,0 +1,150 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class PrincipalCache:
+    """Keeps the users of recently verified tokens in memory, so that
+    get_current_user does not load the user with its projects and roles for
+    every request.
+
+    An entry is keyed by the user id and the issue time of the token and is
+    used for ttl seconds. The user is a detached SqlUser with its
+    relationships loaded, shared by the requests of the token, so it must not
+    be changed. Changes to a user or to its role assignments invalidate the
+    entries of the user, changes to roles and projects, which can concern
+    every user, clear the cache. A ttl of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self.ttl = 0
+        self.max_entries = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # The token and user of the default principal with the time to renew
+        # them, see get_default
+        self._default: tuple[str, object, float] | None = None
+
+    def init(self, ttl: float = 30, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries.clear()
+        self._default = None
+
+    def get(self, user_id: int, issued_at: datetime | None):
+        entry = self._entries.get((user_id, issued_at))
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end((user_id, issued_at))
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: int, issued_at: datetime | None, user, generation: int):
+        """Store the user loaded at generation, unless users were invalidated
+        since."""
+        if self.ttl <= 0 or generation != self.generation:
+            return
+        self._entries[(user_id, issued_at)] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end((user_id, issued_at))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_default(self) -> tuple[str, object] | None:
+        """The pre-signed token and the user of the default principal, the
+        current user while authentication is not enforced. None when it has
+        to be resolved, at first or after the user changed, or renewed
+        before the token expires."""
+        if self._default is None or self._default[2] <= time.monotonic():
+            return None
+        return self._default[0], self._default[1]
+
+    def set_default(self, token: str, user, renew_at: float, generation: int):
+        if generation != self.generation:
+            return
+        self._default = (token, user, renew_at)
+
+    def invalidate(self, *user_ids: int):
+        """Drop the cached principals of the users."""
+        self.generation += 1
+        for key in [key for key in self._entries if key[0] in user_ids]:
+            del self._entries[key]
+        if self._default is not None and self._default[1].id in user_ids:
+            self._default = None
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._default = None
+
+    def metrics(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+class TokenCache:
+    """Keeps the claims of recently verified tokens in memory, so that a token
+    is decoded and validated once instead of on every request.
+
+    An entry is keyed by the raw token and kept until the token expires, a
+    hit only compares the expiry time with the clock. When the cache holds
+    max_entries tokens the least recently used one is dropped. A max_entries
+    of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.max_entries = 0
+        self.hits = 0
+        self.misses = 0
+
+    def init(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries.clear()
+
+    def get(self, token: str):
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.time():
+            # Decoding the token again raises the expiry error
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, token: str, expires_at: float, claims):
+        if self.max_entries <= 0:
+            return
+        self._entries[token] = (expires_at, claims)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def metrics(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+principal_cache = PrincipalCache()
+token_cache = TokenCache()
@@ -0,0 +1,99 @@
+import json
+from collections import OrderedDict
+
+
+class ComponentCache:
+    """Keeps the components of recently read projects in memory, so that the
+    component list and hierarchy endpoints do not query the database every
+    time.
+
+    An entry is the list of component rows of a project, plain dictionaries
+    ordered by sequence, with the state of the project they were read at:
+    the number of components and their latest updated_at. An entry is only
+    used while the state the caller read from the database is the same, so
+    writes by other processes or directly in the database are noticed.
+
+    Every project also has a version that Component.create, update and
+    delete bump after they commit, so that a read in this process that raced
+    a write does not store its stale rows. When the entries grow beyond
+    max_bytes the least recently used projects are dropped. A max_bytes of 0
+    disables the cache.
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self._versions: dict[int, int] = {}
+        self.max_bytes = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init(self, max_bytes: int = 50 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries.clear()
+        self._versions.clear()
+        self.size = 0
+
+    def version(self, project_id: int) -> int:
+        return self._versions.get(project_id, 0)
+
+    def bump(self, *project_ids: int):
+        """Mark the cached components of the projects as outdated."""
+        for project_id in project_ids:
+            if project_id is None:
+                continue
+            self._versions[project_id] = self.version(project_id) + 1
+            if project_id in self._entries:
+                self._remove(project_id)
+
+    def get(self, project_id: int, state: tuple) -> list[dict] | None:
+        """The rows of the project, if they were read at state."""
+        entry = self._entries.get(project_id)
+        if (
+            entry is None
+            or entry["version"] != self.version(project_id)
+            or entry["state"] != state
+        ):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(project_id)
+        self.hits += 1
+        return entry["rows"]
+
+    def put(self, project_id: int, version: int, state: tuple, rows: list[dict]):
+        """Store the rows read at version and state, unless the project changed
+        since."""
+        if self.max_bytes <= 0 or version != self.version(project_id):
+            return
+        if project_id in self._entries:
+            self._remove(project_id)
+        size = len(json.dumps(rows, default=str))
+        self._entries[project_id] = {
+            "version": version,
+            "state": state,
+            "rows": rows,
+            "size": size,
+        }
+        self.size += size
+        while self.size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, project_id: int):
+        self.size -= self._entries.pop(project_id)["size"]
+
+    def metrics(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "max_bytes": self.max_bytes,
+            "bytes": self.size,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+component_cache = ComponentCache()
@@ -1,17 +1,28 @@
-import json
+import asyncio
 import os
 from io import BytesIO
-from datetime import datetime
 
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
 from lxml import etree
 from sqlalchemy.ext.asyncio import AsyncSession
 from openpyxl import Workbook
 from openpyxl.workbook.views import BookView
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
 
 from app.config import get_config
-from app.html2docx.htmldocx import HtmlToDocx
+from app.html2docx.htmldocx import HtmlToDocx, ImageResolver
 from app.services.database import sessionmanager
+from app.services.docx_templates import docx_templates
+from app.services.export_cache import (
+    export_cache,
+    export_cache_key,
+    fragment_cache,
+    fragment_cache_key,
+)
+from app.services.export_executor import export_executor, report_worker_progress
+from app.services.images import print_image_path
 from app.services.utils import pretty_print
 from app.sqlalchemy_models.components_sql import Component as SqlComponent
 from app.sqlalchemy_models.user_project_role_sql import Project as SqlProject
@@ -19,47 +30,236 @@ from app.sqlalchemy_models.user_project_role_sql import Project as SqlProject
 
 def processHtml(html):
     tree = etree.HTML(html)
-    images = tree.xpath("//img")
-    cwd = os.getcwd()
-    if len(images) > 0:
-        for image in images:
-            src = image.attrib["src"]
-            _, path = src.split("/static/document_images/")
-            store_path = os.path.join(cwd, "app", "static", "document_images", path)
-            image.attrib["src"] = store_path
     html_string = (
         etree.tostring(tree, encoding="utf-8").decode("utf-8").replace("\n", "")
     )
     return html_string
 
 
-async def create_project_docx(spec):
+images_url = "/static/document_images/"
+
+
+class ExportImageResolver(ImageResolver):
+    """Embeds document images from app/static/document_images, using their
+    print variant."""
+
+    def local_path(self, src):
+        path = super().local_path(src)
+        if path is not None and path.startswith(self.static_paths[images_url]):
+            return print_image_path(path)
+        return path
+
+
+template_path = os.path.join(os.getcwd(), "app", "static", "template.docx")
+table_style = "Grid Table 6 Colorful Accent 1"
+# Styles the html of exports refers to, resolved when the template is loaded
+paragraph_styles = ["Title", "List Bullet", "List Number"] + [
+    f"Heading {level}" for level in range(1, 10)
+]
+
+
+def load_template():
+    """Load and validate the export template. Called at startup and as the
+    initializer of every export worker."""
+    return docx_templates.get(template_path, [table_style], paragraph_styles)
+
+
+# Kept per export worker, so images are reused across the exports it renders
+image_resolver = ExportImageResolver(
+    {images_url: os.path.join(os.getcwd(), "app", "static", "document_images", "")}
+)
+
+
+def body_elements(document):
+    """The block level elements of the document body, without the trailing
+    section properties."""
+    return [
+        element for element in document.element.body if element.tag != qn("w:sectPr")
+    ]
+
+
+def uses_relationships(element):
+    """Whether the element refers to a part of the package (image, hyperlink),
+    which makes it unusable in another document."""
+    relationship_prefix = qn("r:id")[: -len("id")]
+    return any(
+        name.startswith(relationship_prefix)
+        for child in element.iter()
+        for name in child.attrib
+    )
+
+
+def render_docx(title_html, component_parts, template_path, table_style, fragments):
+    """Convert the export html into docx bytes. Runs in an export worker.
+
+    component_parts is the list of (fragment_key, html) pairs of the exported
+    components. Components whose key is in fragments are spliced into the body
+    from the cached xml, the others are converted from html.
+
+    Returns the docx, the processed html it was made from and the fragments of
+    the converted components that may be cached.
+    """
+    final_html = processHtml(
+        title_html + "".join(html for _, html in component_parts)
+    )
+    # Fetch the remote images of all components at once, before parsing
+    image_resolver.prefetch(etree.HTML(final_html).xpath("//img/@src"))
+
+    template = docx_templates.get(template_path, [table_style], paragraph_styles)
+    document = template.copy()
+    parser = HtmlToDocx()
+    parser.table_style = table_style
+    parser.image_resolver = image_resolver
+    parser.set_style_ids(document, template.style_ids)
+    parser.add_html_to_document(processHtml(title_html), document)
+    new_fragments = {}
+    for count, (fragment_key, html) in enumerate(component_parts, start=1):
+        if fragment_key in fragments:
+            for element_xml in fragments[fragment_key]:
+                document.element.body.insert_element_before(
+                    parse_xml(element_xml), "w:sectPr"
+                )
+        else:
+            existing = len(body_elements(document))
+            parser.add_html_to_document(processHtml(html), document)
+            elements = body_elements(document)[existing:]
+            if not any(uses_relationships(element) for element in elements):
+                new_fragments[fragment_key] = [
+                    etree.tostring(element) for element in elements
+                ]
+        report_worker_progress(count, len(component_parts))
+    buffer = BytesIO()
+    document.save(buffer)
+    return buffer.getvalue(), final_html, new_fragments
+
+
+def write_export_file(store_path, content):
+    mode = "wb" if isinstance(content, bytes) else "w"
+    encoding = None if isinstance(content, bytes) else "utf-8"
+    with open(store_path, mode, encoding=encoding) as file:
+        file.write(content)
+
+
+async def report_progress(progress, state, **details):
+    if progress is not None:
+        await progress(state, **details)
+
+
+async def run_rendering(progress, function, *args):
+    """Run function in an export worker, reporting the components it has
+    rendered as the "rendering" progress. A slow listener is only sent the
+    latest progress and does not hold up the render."""
+    if progress is None:
+        return await export_executor.run(function, *args)
 
+    latest = {}
+    changed = asyncio.Event()
+    finished = False
+
+    def worker_progress(completed, total):
+        latest["completed"] = completed
+        changed.set()
+
+    async def report():
+        while not finished:
+            await changed.wait()
+            changed.clear()
+            if latest:
+                details = dict(latest)
+                latest.clear()
+                await report_progress(progress, "rendering", **details)
+
+    await report_progress(progress, "rendering", completed=0)
+    reporter = asyncio.create_task(report())
+    try:
+        return await export_executor.run(function, *args, progress=worker_progress)
+    finally:
+        finished = True
+        changed.set()
+        await reporter
+
+
+async def render_project_docx(spec, progress=None) -> dict:
+    """Load and render a project docx without storing it.
+
+    Returns the export with its file name and cache key. On an export cache
+    hit "cached" holds the stored export, otherwise "content" holds the docx
+    bytes and "html" the html they were made from.
+    """
+    template_mtime = os.path.getmtime(template_path)
+
+    await report_progress(progress, "fetching")
     async with sessionmanager.session() as db:
         project = await SqlProject.get_project_by_id(db, spec.project_id)
-        html = f'<p style="docx-style: Title"><strong>{project.title}</strong></p>'
-        for component_spec in spec.components:
-            component_html = await SqlComponent.get_html_by_id(db, component_spec.id)
-            html += component_html
-
-        final_html = processHtml(html)
-        parser = HtmlToDocx()
-        parser.table_style = "Grid Table 6 Colorful Accent 1"
-        cwd = os.getcwd()
-        template_path = os.path.join(cwd, "app", "static", "template.docx")
-        docx = parser.parse_html_string(final_html, template=template_path)
-        suffix = datetime.now().strftime("%M%S")
-        doc_name = f'{project.title.replace(" ", "_").lower()}_{suffix}'
-        store_path = os.path.join(cwd, "app", "static", "docx", f"{doc_name}.docx")
-        docx.save(store_path)
-        store_path = os.path.join(cwd, "app", "static", "docx", f"{doc_name}.html")
-        url_path = os.path.join("static", "docx", f"{doc_name}.docx")
-        with open(store_path, "w", encoding="utf-8") as file:
-            file.write(final_html)
-
-        return json.dumps(
-            {"status": "success", "name": f"{doc_name}.docx", "url": url_path}
+        title_html = (
+            f'<p style="docx-style: Title"><strong>{project.title}</strong></p>'
         )
+        components = await SqlComponent.get_with_documents_by_ids(
+            db, [component_spec.id for component_spec in spec.components]
+        )
+        component_parts = [
+            (
+                fragment_cache_key(component, documents, template_mtime, table_style),
+                component.to_html(documents),
+            )
+            for component, documents in components
+        ]
+        cache_key = export_cache_key(project, components, "docx", template_mtime)
+        export = {
+            "document_type": "docx",
+            "cache_key": cache_key,
+            "name": export_cache.file_name(
+                cache_key, project.title.replace(" ", "_").lower(), "docx"
+            ),
+            "cached": export_cache.get(cache_key),
+        }
+
+    if export["cached"] is not None:
+        return export
+
+    fragments = fragment_cache.get_many(
+        [fragment_key for fragment_key, _ in component_parts]
+    )
+    export["content"], export["html"], new_fragments = await run_rendering(
+        progress,
+        render_docx,
+        title_html,
+        component_parts,
+        template_path,
+        table_style,
+        fragments,
+    )
+    fragment_cache.put_many(new_fragments)
+    return export
+
+
+async def save_export(export) -> dict:
+    """Store a rendered export under app/static and add it to the export
+    cache."""
+    document_type = export["document_type"]
+    store_path = os.path.join(
+        os.getcwd(), "app", "static", document_type, export["name"]
+    )
+    url_path = os.path.join("static", document_type, export["name"])
+    await asyncio.to_thread(write_export_file, store_path, export["content"])
+    paths = [store_path]
+    if export.get("html") is not None:
+        html_path = os.path.splitext(store_path)[0] + ".html"
+        await asyncio.to_thread(write_export_file, html_path, export["html"])
+        paths.append(html_path)
+
+    result = {"status": "success", "name": export["name"], "url": url_path}
+    export_cache.put(export["cache_key"], result, paths)
+    return result
+
+
+async def create_project_docx(spec, progress=None):
+    export = await render_project_docx(spec, progress)
+    if export["cached"] is not None:
+        return export["cached"]
+
+    await report_progress(progress, "saving")
+    return await save_export(export)
 
 
 def try_to_make_number(value):
@@ -109,128 +309,164 @@ bottom_thick_borders = Border(
 )
 
 heading = Font(bold=True, name="Arial", size=12)
+bold = Font(bold=True)
 
 
-async def create_project_xlsx(spec):
-    async with sessionmanager.session() as db:
-        project = await SqlProject.get_project_by_id(db, spec.project_id)
-        workbook = Workbook()
-        view = [BookView(xWindow=0, yWindow=0, windowWidth=27210, windowHeight=23310)]
-        workbook.views = view
-        del workbook["Sheet"]  # Remove the default sheet
+def get_sheet_blocks(component_json):
+    """Titles, descriptions and table rows of the parameter and interface
+    documents of a component, in the order they appear on its sheet."""
+    blocks = []
+    title = ""
+    for block in component_json["documents"]:
+        component_id = block.get("component_id", "")
+        if block.get("type") == "parameters":
+            title = f"Parameters Scope: {block['document'].get('scope', '')}"
+        else:  # is interface
+            interfaceDef = block["document"].get("interfacedComponent", {})
+            if interfaceDef:
+                if component_id == interfaceDef.get("componentOneId"):
+                    title = f"Interface: {interfaceDef.get('componentOneTitle', '')} with {interfaceDef.get('componentTwoTitle', '')}"
+                else:
+                    title = f"Interface: {interfaceDef.get('componentTwoTitle', '')} with {interfaceDef.get('componentOneTitle', '')}"
+
+        blocks.append(
+            {
+                "title": title,
+                "description": block["document"].get("description", ""),
+                "rows": get_row_data(block["document"].get("parameters")),
+            }
+        )
+    return blocks
 
-        spec_count = 0
 
-        for component_spec in spec.components:
-            component = await SqlComponent.get_by_id(db, component_spec.id)
+def title_cell(worksheet, value):
+    cell = WriteOnlyCell(worksheet, value=value)
+    cell.font = heading
+    return cell
 
-            component_json = await SqlComponent.get_parameters_json_by_component_id(
-                db, component_spec.id
-            )
-            if len(component_json["documents"]) > 0:
-                spec_count += 1
-                workbook.create_sheet(title=component_json["title"])
-                worksheet = workbook[component_json["title"]]
-                worksheet.column_dimensions["A"].width = 30
-                worksheet.column_dimensions["B"].width = 12
-                worksheet.column_dimensions["C"].width = 12
-                worksheet.column_dimensions["D"].width = 30
-                worksheet.column_dimensions["E"].width = 30
-                row_count = 0
-                for block in component_json["documents"]:
-                    component_id = block.get("component_id", "")
-                    if block.get("type") == "parameters":
-                        title = (
-                            f"Parameters Scope: {block['document'].get('scope', '')}"
-                        )
-                    else:  # is interface
-                        interfaceDef = block["document"].get("interfacedComponent", {})
-                        if interfaceDef:
-                            if component_id == interfaceDef.get("componentOneId"):
-                                title = f"Interface: {interfaceDef.get('componentOneTitle', '')} with {interfaceDef.get('componentTwoTitle', '')}"
-                            else:
-                                title = f"Interface: {interfaceDef.get('componentTwoTitle', '')} with {interfaceDef.get('componentOneTitle', '')}"
-
-                    description = block["document"].get("description", "")
-                    worksheet.append(
-                        [
-                            title,
-                        ]
-                    )
-
-                    row_count += 1
-                    worksheet.cell(row=row_count, column=1).font = heading
-                    worksheet.append(
-                        [
-                            "Description",
-                        ]
-                    )
-                    row_count += 1
-                    worksheet.cell(row=row_count, column=1).font = heading
-                    worksheet.append(
-                        [
-                            description,
-                        ]
-                    )
-                    row_count += 1
-                    worksheet.merge_cells(
-                        start_row=row_count,
-                        start_column=1,
-                        end_row=row_count,
-                        end_column=5,
-                    )
-                    worksheet.row_dimensions[row_count].height = 60
-                    worksheet.cell(row=row_count, column=1).alignment = wrap_text
-
-                    data_rows = get_row_data(block["document"].get("parameters"))
-
-                    is_first_row = True
-                    table_row_count = 0
-                    for row in data_rows:
-                        worksheet.append(row)
-                        row_count += 1
-                        for col in range(1, 6):
-                            cell = worksheet.cell(row=row_count, column=col)
-                            cell.alignment = wrap_text
-                            if is_first_row:
-                                cell.font = Font(bold=True)
-                                cell.border = bottom_thick_borders
-                            else:
-                                cell.border = normal_borders
-                            cell.fill = (
-                                table_fill_darker
-                                if table_row_count % 2 == 0
-                                else table_fill_lighter
-                            )
-                            if col in [2, 3]:
-                                cell.alignment = center
-                        is_first_row = False
-                        table_row_count += 1
-                    worksheet.append([])
-                    row_count += 1
-        # Set the first sheet as active
-        if spec_count > 0:
-            workbook.active = 0
+
+def table_cells(worksheet, row, is_first_row, fill):
+    cells = []
+    for col, value in enumerate(row, start=1):
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.alignment = center if col in [2, 3] else wrap_text
+        if is_first_row:
+            cell.font = bold
+            cell.border = bottom_thick_borders
         else:
-            worksheet = workbook.create_sheet(title="No Components")
-            worksheet.append(
-                [
-                    "No components with parameter or interface tables found for this project."
-                ]
-            )
-            worksheet.append(
-                [
-                    "Please add parameter or interface tables to components to see content in this spreadsheet document."
-                ]
+            cell.border = normal_borders
+        cell.fill = fill
+        cells.append(cell)
+    return cells
+
+
+def render_xlsx(sheets):
+    """Write the sheets prepared by create_project_xlsx to xlsx bytes. Runs in an
+    export worker. There is a sheet for every exported component, those
+    without parameter or interface documents are left out.
+
+    The workbook is written in write only mode, rows are streamed to the file as
+    they are appended instead of being kept in memory until the end.
+    """
+    workbook = Workbook(write_only=True)
+    view = [BookView(xWindow=0, yWindow=0, windowWidth=27210, windowHeight=23310)]
+    workbook.views = view
+
+    written = 0
+    for count, sheet in enumerate(sheets, start=1):
+        report_worker_progress(count - 1, len(sheets))
+        if not sheet["blocks"]:
+            continue
+        written += 1
+        worksheet = workbook.create_sheet(title=sheet["title"])
+        # A write only sheet writes the column widths with its first row and
+        # the height of a row when it is appended, both from the dimensions
+        # set beforehand (openpyxl 3.1). Merged cells are written on save.
+        worksheet.column_dimensions["A"].width = 30
+        worksheet.column_dimensions["B"].width = 12
+        worksheet.column_dimensions["C"].width = 12
+        worksheet.column_dimensions["D"].width = 30
+        worksheet.column_dimensions["E"].width = 30
+        row_count = 0
+        for block in sheet["blocks"]:
+            worksheet.append([title_cell(worksheet, block["title"])])
+            worksheet.append([title_cell(worksheet, "Description")])
+            row_count += 3
+            worksheet.merged_cells.add(f"A{row_count}:E{row_count}")
+            worksheet.row_dimensions[row_count].height = 60
+            description = WriteOnlyCell(worksheet, value=block["description"])
+            description.alignment = wrap_text
+            worksheet.append([description])
+
+            for table_row_count, row in enumerate(block["rows"]):
+                fill = (
+                    table_fill_darker
+                    if table_row_count % 2 == 0
+                    else table_fill_lighter
+                )
+                worksheet.append(
+                    table_cells(worksheet, row, table_row_count == 0, fill)
+                )
+            worksheet.append([])
+            row_count += len(block["rows"]) + 1
+    report_worker_progress(len(sheets), len(sheets))
+    if written == 0:
+        worksheet = workbook.create_sheet(title="No Components")
+        worksheet.append(
+            [
+                "No components with parameter or interface tables found for this project."
+            ]
+        )
+        worksheet.append(
+            [
+                "Please add parameter or interface tables to components to see content in this spreadsheet document."
+            ]
+        )
+        worksheet.append([" "])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def render_project_xlsx(spec, progress=None) -> dict:
+    """Load and render a project xlsx without storing it, see
+    render_project_docx."""
+    await report_progress(progress, "fetching")
+    async with sessionmanager.session() as db:
+        project = await SqlProject.get_project_by_id(db, spec.project_id)
+        components = await SqlComponent.get_with_documents_by_ids(
+            db, [component_spec.id for component_spec in spec.components]
+        )
+        sheets = []
+        for component, documents in components:
+            component_json = component.to_parameters_json(documents)
+            sheets.append(
+                {
+                    "title": component_json["title"],
+                    "blocks": get_sheet_blocks(component_json),
+                }
             )
-            worksheet.append([" "])
-        cwd = os.getcwd()
-        suffix = datetime.now().strftime("%M%S")
-        doc_name = f'{project.title.replace(" ", "_").lower()}_{suffix}'
-        store_path = os.path.join(cwd, "app", "static", "xlsx", f"{doc_name}.xlsx")
-        workbook.save(store_path)
-        url_path = os.path.join("static", "xlsx", f"{doc_name}.xlsx")
-
-    return json.dumps(
-        {"status": "success", "name": f"{doc_name}.xlsx", "url": url_path}
-    )
+        cache_key = export_cache_key(project, components, "xlsx")
+        export = {
+            "document_type": "xlsx",
+            "cache_key": cache_key,
+            "name": export_cache.file_name(
+                cache_key, project.title.replace(" ", "_").lower(), "xlsx"
+            ),
+            "cached": export_cache.get(cache_key),
+        }
+
+    if export["cached"] is not None:
+        return export
+
+    export["content"] = await run_rendering(progress, render_xlsx, sheets)
+    return export
+
+
+async def create_project_xlsx(spec, progress=None):
+    export = await render_project_xlsx(spec, progress)
+    if export["cached"] is not None:
+        return export["cached"]
+
+    await report_progress(progress, "saving")
+    return await save_export(export)
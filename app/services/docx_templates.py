@@ -0,0 +1,91 @@
+import copy
+import os
+from io import BytesIO
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+
+
+class DocxTemplate:
+    """A docx template parsed once. Exports start from a copy of it."""
+
+    def __init__(self, path: str, mtime: float, document, style_ids: dict):
+        self.path = path
+        self.mtime = mtime
+        self.document = document
+        self.style_ids = style_ids
+
+    def copy(self):
+        """A new document with the content of the template. Deep copying the
+        parsed package is cheaper than unzipping and parsing the file again."""
+        return copy.deepcopy(self.document)
+
+
+class TemplateManager:
+    """Keeps the docx templates of exports parsed in memory.
+
+    A template is read, validated and has the ids of the styles exports use
+    resolved when it is loaded. A template whose file changed on disk is
+    loaded again on next use. Every export worker process has its own
+    manager.
+    """
+
+    def __init__(self):
+        self._templates: dict[str, DocxTemplate] = {}
+        self.loads = 0
+
+    def load(
+        self,
+        path: str,
+        table_styles: list[str] = (),
+        paragraph_styles: list[str] = (),
+    ) -> DocxTemplate:
+        """Parse the template at path and resolve the ids of its styles.
+
+        table_styles must exist in the template, otherwise a ValueError is
+        raised. paragraph_styles are resolved when the template has them.
+        """
+        mtime = os.path.getmtime(path)
+        with open(path, "rb") as file:
+            content = file.read()
+        try:
+            document = Document(BytesIO(content))
+        except Exception as e:
+            raise ValueError(f"Invalid docx template {path}: {e}") from e
+
+        style_ids = {}
+        for name in table_styles:
+            try:
+                style_ids[(name, WD_STYLE_TYPE.TABLE)] = document.part.get_style_id(
+                    name, WD_STYLE_TYPE.TABLE
+                )
+            except KeyError as e:
+                raise ValueError(f"Template {path} has no table style {name}") from e
+        for name in paragraph_styles:
+            try:
+                style_ids[(name, WD_STYLE_TYPE.PARAGRAPH)] = (
+                    document.part.get_style_id(name, WD_STYLE_TYPE.PARAGRAPH)
+                )
+            except KeyError:
+                pass
+
+        template = DocxTemplate(path, mtime, document, style_ids)
+        self._templates[path] = template
+        self.loads += 1
+        return template
+
+    def get(
+        self,
+        path: str,
+        table_styles: list[str] = (),
+        paragraph_styles: list[str] = (),
+    ) -> DocxTemplate:
+        """The template at path, loaded on first use or when the file
+        changed."""
+        template = self._templates.get(path)
+        if template is None or template.mtime != os.path.getmtime(path):
+            template = self.load(path, table_styles, paragraph_styles)
+        return template
+
+
+docx_templates = TemplateManager()
@@ -0,0 +1,83 @@
+import os
+import re
+from urllib.parse import quote
+
+media_types = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+chunk_size = 64 * 1024
+
+range_pattern = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """Parse a single range Range header into an inclusive (start, end) pair.
+
+    Returns None when the whole content should be sent, i.e. without a header
+    or with a header this does not handle (several ranges, other units). A
+    range that lies outside the content raises a ValueError.
+    """
+    if not range_header:
+        return None
+    match = range_pattern.match(range_header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # Suffix range, the last n bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable for {size} bytes")
+    return start, end
+
+
+def iter_content(content: bytes, start: int, end: int):
+    view = memoryview(content)
+    for offset in range(start, end + 1, chunk_size):
+        yield bytes(view[offset : min(offset + chunk_size, end + 1)])
+
+
+def iter_file(path: str, start: int, end: int):
+    # A sync generator, the streaming response iterates it in a thread.
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """A strong entity tag for a stored file, it changes whenever the file is
+    written again."""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def if_range_matches(if_range: str | None, etag: str) -> bool:
+    """Whether a Range may be served. If-Range uses the strong comparison, a
+    date or another tag means the client holds other bytes and gets all of
+    them."""
+    return if_range is None or if_range.strip() == etag
+
+
+def content_disposition(file_name: str) -> str:
+    """An attachment header for any file name, with an ascii fallback for old
+    clients and the exact name encoded as in RFC 6266."""
+    fallback = "".join(
+        char if " " <= char < "\x7f" and char not in '"\\' else "_"
+        for char in file_name
+    )
+    return (
+        f'attachment; filename="{fallback}"; '
+        f"filename*=UTF-8''{quote(file_name, safe='')}"
+    )
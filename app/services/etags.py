@@ -0,0 +1,54 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from fastapi import Request, Response
+
+
+def make_etag(*state) -> str:
+    """A weak entity tag for the state of a response, e.g. the row count and
+    the latest updated_at of the rows it is made from."""
+    digest = hashlib.sha256(repr(state).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, the W/ prefix is ignored
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag
+        for tag in if_none_match.split(",")
+    )
+
+
+def check_not_modified(
+    request: Request,
+    response: Response,
+    count: int,
+    updated_at: datetime | None,
+    *key,
+) -> Response | None:
+    """Set the ETag and Last-Modified headers of a list response, and return
+    a 304 response when the client already has the current state.
+
+    The state is the number of rows and their latest updated_at, key holds
+    anything else the response depends on. Only If-None-Match is honoured,
+    If-Modified-Since can not see rows that were deleted. The responses have
+    to be revalidated on every use.
+    """
+    headers = {
+        "ETag": make_etag(count, updated_at, *key),
+        "Cache-Control": "no-cache",
+    }
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(
+            updated_at.astimezone(timezone.utc), usegmt=True
+        )
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+
+cache_file_pattern = re.compile(r"_[0-9a-f]{16}\.(docx|xlsx)$")
+
+
+def export_cache_key(
+    project, components, document_type: str, template_mtime: float | None = None
+) -> str:
+    """Hash everything an export is built from.
+
+    components is the list of (component, documents) pairs in export order. Any
+    edit to the project, a component or one of its documents changes an
+    updated_at and therefore the key.
+    """
+    state = {
+        "project": [project.id, project.updated_at.isoformat()],
+        "components": [
+            [
+                component.id,
+                component.updated_at.isoformat(),
+                [
+                    [document.id, document.updated_at.isoformat()]
+                    for document in documents
+                ],
+            ]
+            for component, documents in components
+        ],
+        "document_type": document_type,
+        "template_mtime": template_mtime,
+    }
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+def fragment_cache_key(
+    component, documents, template_mtime: float, table_style: str | None
+) -> str:
+    """Hash everything the docx body of a single component is built from."""
+    state = {
+        "component": [component.id, component.updated_at.isoformat()],
+        "documents": [
+            [document.id, document.updated_at.isoformat()] for document in documents
+        ],
+        "template_mtime": template_mtime,
+        "table_style": table_style,
+    }
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+class ExportCache:
+    """Keeps finished exports on disk so an unchanged export is not rendered
+    again.
+
+    Exports are stored in the usual static/docx and static/xlsx directories
+    with the first 16 characters of their cache key in the file name. When the
+    stored files grow beyond max_bytes the least recently used exports are
+    deleted. A max_bytes of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self.static_dir = ""
+        self.max_bytes = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init(self, static_dir: str, max_bytes: int = 500 * 1024 * 1024):
+        self.static_dir = static_dir
+        self.max_bytes = max_bytes
+        self._entries.clear()
+        self.size = 0
+        self._load_existing()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def file_name(self, key: str, doc_name: str, document_type: str) -> str:
+        return f"{doc_name}_{key[:16]}.{document_type}"
+
+    def get(self, key: str) -> dict | None:
+        """Return the stored export for key, or None on a miss."""
+        entry = self._entries.get(key[:16])
+        if entry is not None and all(map(os.path.exists, entry["paths"])):
+            self._entries.move_to_end(key[:16])
+            self.hits += 1
+            return entry["result"]
+        if entry is not None:
+            self._remove(key[:16])
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: dict, paths: list[str]):
+        """Register the files of a freshly rendered export under key."""
+        if not self.enabled:
+            return
+        if key[:16] in self._entries:
+            self._remove(key[:16], delete_files=False)
+        size = sum(os.path.getsize(path) for path in paths)
+        self._entries[key[:16]] = {"result": result, "paths": paths, "size": size}
+        self.size += size
+        self._evict()
+
+    def discard(self, key: str):
+        """Drop the stored export for key, e.g. when its file went missing."""
+        if key[:16] in self._entries:
+            self._remove(key[:16])
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, short_key: str, delete_files: bool = True):
+        entry = self._entries.pop(short_key)
+        self.size -= entry["size"]
+        if delete_files:
+            for path in entry["paths"]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _load_existing(self):
+        """Pick up the exports stored before a restart, oldest first."""
+        if not self.enabled:
+            return
+        found = []
+        for document_type in ("docx", "xlsx"):
+            directory = os.path.join(self.static_dir, document_type)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = cache_file_pattern.search(name)
+                if match is None:
+                    continue
+                path = os.path.join(directory, name)
+                paths = [path]
+                html_path = path[: -len(".docx")] + ".html"
+                if document_type == "docx" and os.path.exists(html_path):
+                    paths.append(html_path)
+                result = {
+                    "status": "success",
+                    "name": name,
+                    "url": os.path.join("static", document_type, name),
+                }
+                short_key = match.group(0)[1:17]
+                found.append((os.path.getmtime(path), short_key, result, paths))
+        for _, short_key, result, paths in sorted(found, key=lambda item: item[0]):
+            size = sum(os.path.getsize(path) for path in paths)
+            self._entries[short_key] = {"result": result, "paths": paths, "size": size}
+            self.size += size
+        self._evict()
+
+    def metrics(self) -> dict:
+        return {
+            "max_bytes": self.max_bytes,
+            "bytes": self.size,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class FragmentCache:
+    """Keeps the converted docx body of single components in memory, so a
+    project export only has to convert the components that changed.
+
+    A fragment is the list of serialized body elements of a component. When
+    the fragments grow beyond max_bytes the least recently used ones are
+    dropped. A max_bytes of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._fragments: OrderedDict[str, list[bytes]] = OrderedDict()
+        self.max_bytes = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init(self, max_bytes: int = 100 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._fragments.clear()
+        self.size = 0
+
+    def get_many(self, keys: list[str]) -> dict[str, list[bytes]]:
+        found = {}
+        for key in keys:
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                self.misses += 1
+                continue
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            found[key] = fragment
+        return found
+
+    def put_many(self, fragments: dict[str, list[bytes]]):
+        if self.max_bytes <= 0:
+            return
+        for key, fragment in fragments.items():
+            if key in self._fragments:
+                self.size -= self._size_of(self._fragments.pop(key))
+            self._fragments[key] = fragment
+            self.size += self._size_of(fragment)
+        while self.size > self.max_bytes and self._fragments:
+            _, fragment = self._fragments.popitem(last=False)
+            self.size -= self._size_of(fragment)
+            self.evictions += 1
+
+    def _size_of(self, fragment: list[bytes]) -> int:
+        return sum(len(element) for element in fragment)
+
+    def metrics(self) -> dict:
+        return {
+            "max_bytes": self.max_bytes,
+            "bytes": self.size,
+            "entries": len(self._fragments),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+export_cache = ExportCache()
+fragment_cache = FragmentCache()
@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable
+
+# Set in every worker process, see ExportExecutor.init and ExportExecutor.run
+_progress_queue = None
+_task_id = None
+
+
+class ExportExecutorBusy(ValueError):
+    # Seconds a refused client should wait before trying again
+    retry_after = 5
+
+
+def _init_worker(progress_queue, initializer):
+    global _progress_queue
+    _progress_queue = progress_queue
+    if initializer is not None:
+        initializer()
+
+
+def _run_task(task_id, function, *args):
+    global _task_id
+    _task_id = task_id
+    try:
+        return function(*args)
+    finally:
+        _task_id = None
+
+
+def report_worker_progress(completed: int, total: int):
+    """Report the progress of the function running in this worker process to
+    the task awaiting it. Does nothing when nobody listens."""
+    if _progress_queue is not None and _task_id is not None:
+        _progress_queue.put((_task_id, completed, total))
+
+
+class ExportExecutor:
+    """Runs the CPU heavy part of document exports in a pool of processes, so
+    that the event loop only has to await the result.
+
+    Renders are limited to max_concurrency at a time, further renders wait in
+    the queue. When max_queued renders are already waiting new renders are
+    refused with ExportExecutorBusy.
+
+    Functions running in a worker report their progress with
+    report_worker_progress. The reports are sent back through a queue and
+    handed to the progress callback of the run on the event loop.
+    """
+
+    def __init__(self):
+        self._executor: ProcessPoolExecutor | None = None
+        self.name = "exports"
+        self._semaphore: asyncio.Semaphore | None = None
+        self._progress_queue = None
+        self._progress_reader: threading.Thread | None = None
+        self._listeners: dict[int, Callable] = {}
+        self._task_ids = itertools.count(1)
+        self.max_workers = 0
+        self.max_concurrency = 0
+        self.max_queued = 0
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def init(
+        self,
+        max_workers: int = 2,
+        max_concurrency: int | None = None,
+        max_queued: int = 50,
+        initializer=None,
+        name: str = "exports",
+    ):
+        """initializer is called without arguments in every worker process
+        when it starts, e.g. to load what all renders need. name is used in
+        the error when the queue is full."""
+        self.name = name
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers
+        self.max_queued = max_queued
+        context = multiprocessing.get_context()
+        self._progress_queue = context.SimpleQueue()
+        self._progress_reader = threading.Thread(
+            target=self._read_progress,
+            args=(self._progress_queue, self._listeners),
+            name=f"{name}-progress",
+            daemon=True,
+        )
+        self._progress_reader.start()
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._progress_queue, initializer),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def init_done(self):
+        return self._executor is not None
+
+    def close(self):
+        if self._executor is None:
+            raise RuntimeError("ExportExecutor is not initialized")
+
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._semaphore = None
+        self._progress_queue.put(None)
+        self._progress_reader.join()
+        self._progress_queue.close()
+        self._progress_queue = None
+        self._progress_reader = None
+        self._listeners.clear()
+
+    @staticmethod
+    def _read_progress(progress_queue, listeners: dict):
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            task_id, completed, total = message
+            listener = listeners.get(task_id)
+            if listener is not None:
+                listener(completed, total)
+
+    async def run(self, function, *args, progress=None):
+        """Run function(*args) in a worker process and return its result.
+
+        The function and its arguments must be picklable, i.e. module level
+        functions with plain data as arguments. progress is called on the
+        event loop with (completed, total) for every report_worker_progress
+        of the function. Reports arriving after the function returned are
+        dropped.
+        """
+        if self._executor is None:
+            raise RuntimeError("ExportExecutor is not initialized")
+        if self.queued >= self.max_queued:
+            raise ExportExecutorBusy(
+                f"Too many {self.name} in progress, try again later"
+            )
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        semaphore = self._semaphore
+        loop = asyncio.get_running_loop()
+        task_id = None
+        if progress is not None:
+            task_id = next(self._task_ids)
+
+            def listener(completed, total):
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(progress, completed, total)
+
+            self._listeners[task_id] = listener
+        try:
+            future = self._executor.submit(_run_task, task_id, function, *args)
+        except BaseException:
+            self._finished(semaphore, task_id, None)
+            raise
+
+        # A worker process keeps rendering when the awaiting task is
+        # cancelled, so the slot is only released once the render is done
+        def done(future: Future):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._finished, semaphore, task_id, future)
+
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _finished(
+        self, semaphore: asyncio.Semaphore, task_id: int | None, future: Future | None
+    ):
+        self._listeners.pop(task_id, None)
+        self.running -= 1
+        semaphore.release()
+        if future is None or future.cancelled():
+            return
+        if future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def metrics(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queued": self.max_queued,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+export_executor = ExportExecutor()
+# Uploaded images get their own workers, so they do not wait for exports
+image_executor = ExportExecutor()
@@ -0,0 +1,158 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from app.pydantic_models.export_model import ExportJobResponse, ExportProgressEvent
+from app.services.create_docx import create_project_docx, create_project_xlsx
+
+exporters = {
+    "docx": create_project_docx,
+    "xlsx": create_project_xlsx,
+}
+
+finished_states = ("done", "failed", "cancelled")
+
+
+class ExportJob:
+    def __init__(self, spec, owner_id: int | None = None):
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.project_id = spec.project_id
+        self.document_type = spec.document_type
+        self.owner_id = owner_id
+        self.state = "queued"
+        self.total = len(spec.components)
+        self.completed = 0
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now(timezone.utc)
+        self.updated_at = self.created_at
+        self.task: asyncio.Task | None = None
+        self.listeners = set()
+
+    @property
+    def finished(self):
+        return self.state in finished_states
+
+    def to_response(self) -> ExportJobResponse:
+        return ExportJobResponse.model_validate(self)
+
+
+class ExportJobManager:
+    """Runs document exports as background jobs.
+
+    Jobs are kept in memory independent of the websocket or request that
+    created them, so a client can queue several exports and poll, subscribe
+    to or cancel them later. The number of renders running at the same time
+    is capped by the export executor. The most recent max_history finished
+    jobs are kept, older ones are forgotten.
+    """
+
+    def __init__(self):
+        self._jobs: OrderedDict[str, ExportJob] = OrderedDict()
+        self.max_history = 100
+
+    def init(self, max_history: int = 100):
+        self.max_history = max_history
+
+    def submit(self, spec, owner_id: int, listener=None) -> ExportJob:
+        if spec.document_type not in exporters:
+            raise ValueError(f"Unknown document type {spec.document_type}")
+
+        job = ExportJob(spec, owner_id)
+        if listener is not None:
+            job.listeners.add(listener)
+        self._jobs[job.id] = job
+        self._prune()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str, owner_id: int) -> ExportJob:
+        """The job, if it belongs to owner_id. The jobs of other users are
+        not found, so that their ids can not be probed."""
+        job = self._jobs.get(job_id)
+        if job is None or job.owner_id != owner_id:
+            raise ValueError("Export job not found")
+        return job
+
+    def list(self, owner_id: int | None = None) -> list[ExportJob]:
+        return [
+            job
+            for job in self._jobs.values()
+            if owner_id is None or job.owner_id == owner_id
+        ]
+
+    def subscribe(self, job_id: str, owner_id: int, listener) -> ExportJob:
+        job = self.get(job_id, owner_id)
+        job.listeners.add(listener)
+        return job
+
+    def unsubscribe(self, listener):
+        for job in self._jobs.values():
+            job.listeners.discard(listener)
+
+    async def cancel(self, job_id: str, owner_id: int) -> ExportJob:
+        job = self.get(job_id, owner_id)
+        if job.finished:
+            raise ValueError(f"Export job is already {job.state}")
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+        if not job.finished:
+            # The task was cancelled before it got to run.
+            await self._set_state(job, "cancelled")
+            job.spec = None
+        return job
+
+    async def close(self):
+        tasks = [job.task for job in self._jobs.values() if not job.finished]
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled jobs finish before the executors are shut down
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._jobs.clear()
+
+    async def _run(self, job: ExportJob):
+        async def progress(state, completed=None):
+            if completed is not None:
+                job.completed = completed
+            await self._set_state(job, state)
+
+        try:
+            result = await exporters[job.document_type](job.spec, progress)
+        except asyncio.CancelledError:
+            await self._set_state(job, "cancelled")
+        except Exception as error:
+            job.error = str(error)
+            await self._set_state(job, "failed")
+        else:
+            job.result = result
+            await self._set_state(job, "done")
+        finally:
+            job.spec = None
+            self._prune()
+
+    async def _set_state(self, job: ExportJob, state: str):
+        job.state = state
+        job.updated_at = datetime.now(timezone.utc)
+        if not job.listeners:
+            return
+        message = ExportProgressEvent(job=job.to_response()).model_dump_json(
+            by_alias=True
+        )
+        for listener in list(job.listeners):
+            try:
+                await listener(message)
+            except Exception:
+                job.listeners.discard(listener)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(len(finished) - self.max_history, 0)]:
+            del self._jobs[job_id]
+
+
+export_jobs = ExportJobManager()
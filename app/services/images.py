@@ -0,0 +1,121 @@
+import os
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+# Width in inches images are placed at in exported documents, see
+# HtmlToDocx.handle_img
+PRINT_WIDTH = 6.25
+PRINT_DPI = 200
+THUMBNAIL_WIDTH = 320
+
+variant_names = ("print", "thumb")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def variant_dir(images_path: str):
+    return os.path.join(images_path, "variants")
+
+
+def variant_file_name(file_name: str, variant: str, image) -> str:
+    """Variants are named after the uuid of the original, e.g.
+    <uuid>.print.jpg. Images with transparency stay png, all others are stored
+    as jpeg."""
+    stem = os.path.splitext(file_name)[0]
+    extension = "png" if has_transparency(image) else "jpg"
+    return f"{stem}.{variant}.{extension}"
+
+
+def has_transparency(image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def find_variant(store_path: str, variant: str) -> str | None:
+    """Path of a stored variant of the image at store_path, if there is one."""
+    images_path, file_name = os.path.split(store_path)
+    stem = os.path.splitext(file_name)[0]
+    for extension in ("jpg", "png"):
+        path = os.path.join(variant_dir(images_path), f"{stem}.{variant}.{extension}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def stored_variants(store_path: str) -> dict[str, str]:
+    """File names of the variants already stored for the image."""
+    stored = {}
+    for variant in variant_names:
+        path = find_variant(store_path, variant)
+        if path is not None:
+            stored[variant] = os.path.basename(path)
+    return stored
+
+
+def save_variant(image, path: str):
+    # Written under a temporary name first, so a concurrent reader never sees a
+    # half written variant.
+    temporary_path = f"{path}.tmp"
+    if path.endswith(".png"):
+        image.save(temporary_path, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(
+            temporary_path, format="JPEG", quality=85, optimize=True, progressive=True
+        )
+    os.replace(temporary_path, path)
+
+
+def process_image(store_path: str, dpi: int = PRINT_DPI) -> dict[str, str]:
+    """Store the print and thumbnail variants of an uploaded image.
+
+    The print variant is downscaled to the printable width of exported
+    documents at dpi, the thumbnail is meant for the editor. Both are
+    re-encoded without metadata, after applying the exif orientation. Images
+    are never upscaled. Runs in an export worker.
+
+    Returns the file names of the stored variants, nothing is stored when
+    Pillow is not installed. Raises InvalidImage when the file is not an
+    image Pillow can read or has more pixels than it accepts to decode.
+    """
+    if Image is None:
+        return {}
+    images_path, file_name = os.path.split(store_path)
+    try:
+        with Image.open(store_path) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except Image.DecompressionBombError:
+        raise InvalidImage("The image has too many pixels")
+    except (UnidentifiedImageError, OSError):
+        raise InvalidImage("The file is not an image that can be read")
+
+    os.makedirs(variant_dir(images_path), exist_ok=True)
+
+    widths = {"print": int(PRINT_WIDTH * dpi), "thumb": THUMBNAIL_WIDTH}
+    stored = {}
+    for variant in variant_names:
+        resized = image.copy()
+        resized.thumbnail((widths[variant], widths[variant] * 10), Image.LANCZOS)
+        name = variant_file_name(file_name, variant, resized)
+        save_variant(resized, os.path.join(variant_dir(images_path), name))
+        stored[variant] = name
+    return stored
+
+
+def print_image_path(store_path: str) -> str:
+    """Path of the image to embed in exported documents. Images uploaded
+    before variants existed get them on first use."""
+    path = find_variant(store_path, "print")
+    if path is None and os.path.exists(store_path):
+        try:
+            if process_image(store_path):
+                path = find_variant(store_path, "print")
+        except InvalidImage:
+            pass
+    return path or store_path
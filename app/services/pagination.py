@@ -0,0 +1,100 @@
+import base64
+import binascii
+import bisect
+import json
+from typing import Annotated, Callable
+
+from fastapi import Query, Response
+from sqlalchemy import Select, tuple_
+
+max_page_size = 1000
+next_cursor_header = "X-Next-Cursor"
+
+
+def encode_cursor(key: tuple) -> str:
+    """An opaque cursor holding the sort key of the last row of a page."""
+    data = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> tuple:
+    """The sort key held by a cursor, checked against the types of the key
+    columns, so that a forged cursor can not reach the query or the sort."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(data)
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, value_type in zip(key, types):
+        # bool is an int, but not a valid int key
+        if type(value) is not value_type:
+            raise ValueError("Invalid cursor")
+        if value_type is int and not -(2**63) <= value < 2**63:
+            raise ValueError("Invalid cursor")
+        if value_type is str and "\x00" in value:
+            raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def keyset(query: Select, columns: list, limit: int | None, after: str | None):
+    """Order query by columns and restrict it to the page following the row
+    of the after cursor. The last of columns has to be unique, e.g. the id.
+
+    One row more than limit is selected, page tells from it whether there is
+    a next page.
+    """
+    query = query.order_by(*columns)
+    if after is not None:
+        types = tuple(column.type.python_type for column in columns)
+        query = query.where(tuple_(*columns) > decode_cursor(after, types))
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+
+def page(rows: list, limit: int | None, key: Callable) -> tuple[list, str | None]:
+    """The rows of a page selected with keyset and the cursor of the next
+    page, None on the last page."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def page_sorted(
+    rows: list,
+    limit: int | None,
+    after: str | None,
+    key: Callable,
+    types: tuple[type, ...],
+) -> tuple[list, str | None]:
+    """Like keyset and page together, for rows that are already in memory and
+    sorted by key. types are the types of the values of key."""
+    if after is not None:
+        start = bisect.bisect_right(rows, decode_cursor(after, types), key=key)
+        rows = rows[start:]
+    if limit is not None:
+        rows = rows[: limit + 1]
+    return page(rows, limit, key)
+
+
+class PageParams:
+    """The limit and after query parameters of a paginated listing. Without a
+    limit all rows are listed."""
+
+    def __init__(
+        self,
+        limit: Annotated[int | None, Query(ge=1, le=max_page_size)] = None,
+        after: Annotated[str | None, Query()] = None,
+    ):
+        self.limit = limit
+        self.after = after
+
+
+def set_next_cursor(response: Response, cursor: str | None):
+    """Pass the cursor of the next page in the X-Next-Cursor header, the
+    listings keep returning plain lists."""
+    if cursor is not None:
+        response.headers[next_cursor_header] = cursor
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+
+class PasswordServiceBusy(ValueError):
+    pass
+
+
+class PasswordService:
+    """Hashes and verifies passwords in a pool of threads. bcrypt spends a few
+    hundred milliseconds of CPU on a password and releases the GIL meanwhile,
+    so the event loop keeps serving other requests.
+
+    At most max_workers passwords are processed at a time, further ones wait.
+    When max_queued are already waiting new ones are refused with
+    PasswordServiceBusy.
+    """
+
+    def __init__(self):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self._executor: ThreadPoolExecutor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.max_workers = 0
+        self.max_queued = 0
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.refused = 0
+
+    def init(self, max_workers: int = 2, max_queued: int = 100):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="passwords"
+        )
+        self._semaphore = asyncio.Semaphore(max_workers)
+
+    def init_done(self):
+        return self._executor is not None
+
+    def close(self):
+        if self._executor is None:
+            raise RuntimeError("PasswordService is not initialized")
+
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._semaphore = None
+
+    async def _run(self, function, *args):
+        if self._executor is None:
+            raise RuntimeError("PasswordService is not initialized")
+        if self.queued >= self.max_queued:
+            self.refused += 1
+            raise PasswordServiceBusy("Too many logins in progress, try again later")
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, function, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str | None) -> bool:
+        """Whether password matches the hash. A missing hash takes as long to
+        check as a real one and does not match."""
+        return await self._run(self.context.verify, password, hashed_password)
+
+    def metrics(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queued": self.max_queued,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "refused": self.refused,
+        }
+
+
+class LoginThrottle:
+    """Limits login attempts so that passwords can not be guessed at the speed
+    of the password workers.
+
+    A client address may make max_address_attempts login attempts within
+    window seconds, whatever the usernames, so that one client can not try
+    many usernames or fill the queue of the password service. A username may
+    in addition fail to log in from an address max_attempts times within the
+    window. Only failed attempts count towards that and a successful login
+    forgets them, so that users behind the same proxy or NAT do not lock each
+    other out. Behind a reverse proxy run uvicorn with --proxy-headers and
+    --forwarded-allow-ips set to the address of the proxy, otherwise every
+    client has the address of the proxy.
+
+    At most max_addresses addresses and max_addresses (address, username)
+    keys are tracked. Keys without attempts in the window are forgotten first,
+    then the keys with the oldest attempts.
+    """
+
+    def __init__(self):
+        self._addresses: OrderedDict[str, deque[float]] = OrderedDict()
+        self._attempts: OrderedDict[tuple[str, str], deque[float]] = OrderedDict()
+        self.max_attempts = 0
+        self.max_address_attempts = 0
+        self.window = 0.0
+        self.max_addresses = 0
+        self.throttled = 0
+
+    def init(
+        self,
+        max_attempts: int = 10,
+        window: float = 60,
+        max_addresses: int = 10000,
+        max_address_attempts: int = 100,
+    ):
+        self.max_attempts = max_attempts
+        self.max_address_attempts = max_address_attempts
+        self.window = window
+        self.max_addresses = max_addresses
+        self._addresses.clear()
+        self._attempts.clear()
+
+    def check(self, address: str, username: str) -> float:
+        """Returns 0 when username may try to log in from address and counts
+        the attempt of the address, otherwise the seconds until it may. A
+        max_attempts or max_address_attempts of 0 disables that limit."""
+        now = time.monotonic()
+        retry_after = max(
+            self._wait(self._addresses, address, self.max_address_attempts, now),
+            self._wait(self._attempts, (address, username), self.max_attempts, now),
+        )
+        if retry_after:
+            self.throttled += 1
+            return retry_after
+        if self.max_address_attempts > 0:
+            self._record(self._addresses, address, now)
+        return 0
+
+    def fail(self, address: str, username: str):
+        """Record a failed login attempt of username from address."""
+        if self.max_attempts <= 0:
+            return
+        self._record(self._attempts, (address, username), time.monotonic())
+
+    def succeed(self, address: str, username: str):
+        """Forget the failed attempts of username from address."""
+        self._attempts.pop((address, username), None)
+
+    def _wait(self, tracked: OrderedDict, key, max_attempts: int, now: float) -> float:
+        if max_attempts <= 0:
+            return 0
+        attempts = tracked.get(key)
+        if not attempts:
+            return 0
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if len(attempts) < max_attempts:
+            return 0
+        return attempts[0] + self.window - now
+
+    def _record(self, tracked: OrderedDict, key, now: float):
+        attempts = tracked.get(key)
+        if attempts is None:
+            attempts = tracked[key] = deque()
+        else:
+            tracked.move_to_end(key)
+        attempts.append(now)
+        if len(tracked) > self.max_addresses:
+            self._forget(tracked, now)
+
+    def _forget(self, tracked: OrderedDict, now: float):
+        for key in [
+            key
+            for key, attempts in tracked.items()
+            if not attempts or attempts[-1] <= now - self.window
+        ]:
+            del tracked[key]
+        # Keys are ordered by their last attempt
+        while len(tracked) > self.max_addresses:
+            tracked.popitem(last=False)
+
+    def metrics(self) -> dict:
+        return {
+            "max_attempts": self.max_attempts,
+            "max_address_attempts": self.max_address_attempts,
+            "window": self.window,
+            "addresses": len(self._addresses),
+            "keys": len(self._attempts),
+            "throttled": self.throttled,
+        }
+
+
+password_service = PasswordService()
+login_throttle = LoginThrottle()
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import os
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+chunk_size = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+async def store_upload(upload, store_path: str, max_bytes: int) -> tuple[int, str]:
+    """Copy an uploaded file to store_path in chunks.
+
+    Chunks are written in a thread, so the event loop is not blocked by the
+    disk. Raises UploadTooLarge, and removes the partial file, as soon as more
+    than max_bytes have been read.
+
+    Returns the size and the sha256 hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    local_file = await asyncio.to_thread(open, store_path, "wb")
+    try:
+        while chunk := await upload.read(chunk_size):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(
+                    f"{upload.filename} exceeds the upload limit of {max_bytes} bytes"
+                )
+            digest.update(chunk)
+            await asyncio.to_thread(local_file.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(local_file.close)
+        await asyncio.to_thread(os.remove, store_path)
+        raise
+    await asyncio.to_thread(local_file.close)
+    return size, digest.hexdigest()
+
+
+class RequestBodyLimit:
+    """Middleware that refuses request bodies of more than max_bytes with a
+    413.
+
+    Starlette reads a multipart body completely before the view runs, so a
+    view can not limit it. A body announced larger by Content-Length is
+    refused before it is read, any other body as soon as more than max_bytes
+    have been received, also when it is sent chunked or Content-Length is too
+    small. The application then sees the client disconnect and its response
+    is replaced by the 413.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        too_large = JSONResponse(
+            {"detail": f"Request body exceeds the limit of {self.max_bytes} bytes"},
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit():
+                if int(value) > self.max_bytes:
+                    await too_large(scope, receive, send)
+                    return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def limited_send(message):
+            nonlocal response_started
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await too_large(scope, receive, send)
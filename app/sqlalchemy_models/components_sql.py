@@ -1,12 +1,25 @@
+from datetime import datetime
 from uuid import uuid4
 import json
 
-from sqlalchemy import ForeignKey, Integer, String, func, select
+from sqlalchemy import (
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    exists,
+    func,
+    literal,
+    select,
+    update,
+)
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.services.component_cache import component_cache
 from app.services.database import BaseEntity
+from app.services.pagination import page_sorted
 from app.services.utils import translate_exception
 from app.sqlalchemy_models.documents_sql import Document
 from app.sqlalchemy_models.user_project_role_sql import Project as SqlProject
@@ -26,39 +39,131 @@ class Component(AsyncAttrs, BaseEntity):
     level: Mapped[int] = mapped_column(Integer, nullable=False)
     description: Mapped[str] = mapped_column(String)
     sequence: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Materialized path of ids from the root down to the component, e.g. "/1/3/7/".
+    # The "C" collation keeps the ordering bytewise so that a subtree is a single
+    # range scan on the index.
+    path: Mapped[str] = mapped_column(
+        String(collation="C"), nullable=False, default=""
+    )
     # is_template: Mapped[bool] = mapped_column(
     #     Boolean, nullable=False, default=False)
     children: Mapped[list["Component"]] = relationship("Component")
 
+    __table_args__ = (
+        Index("ix_components_path", "path"),
+        Index("ix_components_project_id_updated_at", "project_id", "updated_at"),
+    )
+
     # This check were moved to Pydantic Validations
     # __table_args__ = (
     #     UniqueConstraint("parent_id", "title"),
     #     CheckConstraint('length(title) > 5', name='title_length'), )
 
     @classmethod
-    async def get_all(cls, db, project_id: int):
-        return (
-            (await db.execute(select(cls).where(cls.project_id == project_id)))
-            .scalars()
-            .all()
-        )
+    def subtree_filter(cls, path: str):
+        """Range condition matching the component with this path and all its
+        descendants. Ids are separated by "/", the next character after it is
+        "0", so the range ends where the path with the last "/" replaced by
+        "0" starts."""
+        return (cls.path >= path) & (cls.path < path[:-1] + "0")
+
+    @classmethod
+    async def get_path(cls, db, component_id: int | None) -> str:
+        if component_id is None:
+            return "/"
+        path = (
+            await db.execute(select(cls.path).where(cls.id == component_id))
+        ).scalar_one_or_none()
+        if path is None:
+            raise ValueError("Component not found")
+        return path
 
     @classmethod
-    async def get_root_components(cls, db, project_id: int):
+    async def get_descendants(cls, db, component_id: int) -> list["Component"]:
+        """All components below the given component, ordered by sequence."""
+        path = await cls.get_path(db, component_id)
         return (
             (
                 await db.execute(
                     select(cls)
-                    .where(cls.project_id == project_id)
-                    # this format is required by sqlalchemy, "is None" does not work
-                    .where(cls.parent_id == None)  # noqa: E711
-                    .order_by(cls.sequence)
+                    .where(cls.subtree_filter(path))
+                    .where(cls.id != component_id)
+                    .order_by(cls.sequence, cls.id)
                 )
             )
             .scalars()
             .all()
         )
 
+    @classmethod
+    async def get_rows(cls, db, project_id: int) -> list[dict]:
+        """The components of a project as row dictionaries with the row_fields,
+        ordered by sequence.
+
+        Served from the component cache while the state of the project in the
+        database is unchanged. The rows are shared, callers must not modify
+        them.
+        """
+        state = await cls.get_state(db, project_id)
+        rows = component_cache.get(project_id, state)
+        if rows is not None:
+            return rows
+        version = component_cache.version(project_id)
+        try:
+            result = await db.execute(
+                select(*(getattr(cls, field) for field in cls.row_fields))
+                .where(cls.project_id == project_id)
+                .order_by(cls.sequence, cls.id)
+            )
+        except Exception as error:
+            exception = translate_exception(__name__, "get", error)
+            raise exception
+        rows = [dict(row) for row in result.mappings()]
+        # The state of the rows read, which may be newer than the state above
+        rows_state = (
+            len(rows),
+            max((row["updated_at"] for row in rows), default=None),
+        )
+        component_cache.put(project_id, version, rows_state, rows)
+        return rows
+
+    @classmethod
+    async def get_state(cls, db, project_id: int) -> tuple[int, datetime | None]:
+        """The number of components of a project and their latest updated_at,
+        which change with every create, update and delete."""
+        try:
+            count, updated_at = (
+                await db.execute(
+                    select(func.count(cls.id), func.max(cls.updated_at)).where(
+                        cls.project_id == project_id
+                    )
+                )
+            ).one()
+        except Exception as error:
+            exception = translate_exception(__name__, "get", error)
+            raise exception
+        return count, updated_at
+
+    @classmethod
+    async def get_all(cls, db, project_id: int) -> list[dict]:
+        return await cls.get_rows(db, project_id)
+
+    @classmethod
+    async def get_page(
+        cls, db, project_id: int, limit: int | None = None, after: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        """A page of the components of a project ordered by sequence and the
+        cursor of the next, cut from the cached rows."""
+        rows = await cls.get_rows(db, project_id)
+        return page_sorted(
+            rows, limit, after, lambda row: (row["sequence"], row["id"]), (int, int)
+        )
+
+    @classmethod
+    async def get_root_components(cls, db, project_id: int) -> list[dict]:
+        rows = await cls.get_rows(db, project_id)
+        return [row for row in rows if row["parent_id"] is None]
+
     @classmethod
     async def create(
         cls,
@@ -88,6 +193,14 @@ class Component(AsyncAttrs, BaseEntity):
         else:
             max_sequence = sequence
 
+        parent_path = "/"
+        if parent_id is not None:
+            parent_path = (
+                await db.execute(select(cls.path).where(cls.id == parent_id))
+            ).scalar_one_or_none()
+            if parent_path is None:
+                raise ValueError("Parent component not found")
+
         component = cls(
             project_id=project_id,
             parent_id=parent_id,
@@ -102,7 +215,11 @@ class Component(AsyncAttrs, BaseEntity):
         )
         try:
             db.add(component)
+            # The id is only known once the row is inserted
+            await db.flush()
+            component.path = f"{parent_path}{component.id}/"
             await db.commit()
+            component_cache.bump(project_id)
             await db.refresh(component)
         except Exception as error:
             await db.rollback()
@@ -170,6 +287,7 @@ class Component(AsyncAttrs, BaseEntity):
         description: str = None,
     ) -> "Component":
         component = await cls.get_by_id(db, component_id)
+        old_project_id = component.project_id
 
         if title is not None:
             component.title = title
@@ -177,14 +295,36 @@ class Component(AsyncAttrs, BaseEntity):
         if project_id is not None:
             component.project_id = project_id
 
-        if level is not None:
-            component.level = level
-
         if structure_code is not None:
             component.structure_code = structure_code
 
-        if parent_id is not None:
+        if parent_id is not None and parent_id != component.parent_id:
+            old_path = component.path
+            new_path = f"{await cls.get_path(db, parent_id)}{component.id}/"
+            if new_path.startswith(old_path):
+                raise ValueError(
+                    "A component cannot be moved below one of its descendants"
+                )
+            # Re-root the component and all its descendants in one statement,
+            # their levels change by the difference in depth
+            depth_change = new_path.count("/") - old_path.count("/")
+            await db.execute(
+                update(cls)
+                .where(cls.subtree_filter(old_path))
+                .values(
+                    path=literal(new_path)
+                    + func.substr(cls.path, len(old_path) + 1, type_=String),
+                    level=cls.level + depth_change,
+                )
+                .execution_options(synchronize_session=False)
+            )
             component.parent_id = parent_id
+            component.path = new_path
+            component.level += depth_change
+
+        # Set after the move, which already shifted the stored level
+        if level is not None:
+            component.level = level
 
         if description is not None:
             component.description = description
@@ -195,8 +335,10 @@ class Component(AsyncAttrs, BaseEntity):
         if user_id is not None:
             component.updated_by = user_id
 
+        new_project_id = component.project_id
         try:
             await db.commit()
+            component_cache.bump(old_project_id, new_project_id)
             await db.refresh(component)
         except Exception as error:
             await db.rollback()
@@ -209,10 +351,24 @@ class Component(AsyncAttrs, BaseEntity):
         # TODO: check if component has has siblings that follow it (i.e. sibling with higher sequence)
         # if so, reduce the sequence of the siblings by one
         component = await cls.get_by_id(db, component_id)
+        # Only leaves are deleted, so no other paths have to change
+        has_descendants = (
+            await db.execute(
+                select(
+                    exists().where(
+                        cls.subtree_filter(component.path), cls.id != component_id
+                    )
+                )
+            )
+        ).scalar()
+        if has_descendants:
+            raise ValueError("Cannot delete a component with children")
 
+        project_id = component.project_id
         try:
             await db.delete(component)
             await db.commit()
+            component_cache.bump(project_id)
         except Exception as error:
             await db.rollback()
             exception = translate_exception(__name__, "delete", error)
@@ -237,55 +393,155 @@ class Component(AsyncAttrs, BaseEntity):
             raise ValueError("component not found")
         return children
 
+    # Columns copied into the nested hierarchy dictionaries, the keys match the
+    # fields of the Pydantic "ComponentWithChildren" model.
+    hierarchy_fields = (
+        "id",
+        "uuid",
+        "project_id",
+        "parent_id",
+        "title",
+        "description",
+        "level",
+        "structure_code",
+        "sequence",
+    )
+    # Columns of the rows kept in the component cache
+    row_fields = hierarchy_fields + ("path", "updated_at")
+
     @classmethod
-    async def get_html_by_id(cls, db, component_id: int) -> str:
-        # Component id is unique in the datatable so project_id is irrelevant
-        try:
-            component = await db.get(cls, component_id)
-            if component is None:
-                raise ValueError("Component not found")
+    def build_hierarchy(cls, rows: list[dict], root_ids: set[int]) -> list[dict]:
+        """Nest a flat list of component rows under their parents in a single
+        pass.
+
+        The rows must be ordered by sequence, the children of every node then
+        end up in sequence order as well.
+        """
+        nodes = {}
+        for row in rows:
+            node = {field: row[field] for field in cls.hierarchy_fields}
+            node["children"] = []
+            nodes[row["id"]] = node
+
+        roots = []
+        for row in rows:
+            node = nodes[row["id"]]
+            if row["id"] in root_ids:
+                roots.append(node)
+            elif row["parent_id"] in nodes:
+                nodes[row["parent_id"]]["children"].append(node)
+        return roots
 
-            documents = await Document.get_by_component_id(db, component.id)
-            component_html = f"<h1>{component.title}</h1>"
-            for document in documents:
-                component_html += await Document.get_html_by_document_id(
-                    db, document.id
+    @classmethod
+    async def get_hierarchy(
+        cls,
+        db,
+        project_id: int | None = None,
+        component_id: int | None = None,
+        recursion_level: int = 10,
+    ) -> list[dict]:
+        """Load a component subtree, or the whole forest of a project, with a
+        single indexed query on the materialized path.
+
+        When component_id is given the list contains only that component,
+        otherwise it contains the root components of the project. The forest
+        of a project is built from the component cache when it is current.
+        """
+        if component_id is not None:
+            root_path = await cls.get_path(db, component_id)
+            root_depth = root_path.count("/")
+            try:
+                result = await db.execute(
+                    select(*(getattr(cls, field) for field in cls.row_fields))
+                    .where(cls.subtree_filter(root_path))
+                    .order_by(cls.sequence, cls.id)
                 )
+            except Exception as error:
+                exception = translate_exception(__name__, "get", error)
+                raise exception
+            rows = result.mappings().all()
+        else:
+            # Root components have paths like "/1/"
+            root_depth = 2
+            rows = await cls.get_rows(db, project_id)
 
-        except Exception as error:
-            if type(error) is ValueError:
-                raise error
-            exception = translate_exception(__name__, "get", error)
-            raise exception
-        return component_html
+        depth = max(
+            (row["path"].count("/") - root_depth for row in rows),
+            default=0,
+        )
+        if depth > recursion_level:
+            raise ValueError(f"Recursion level of {recursion_level} exceeded")
+
+        if component_id is not None:
+            root_ids = {component_id}
+        else:
+            root_ids = {row["id"] for row in rows if row["parent_id"] is None}
+        return cls.build_hierarchy(rows, root_ids)
 
     @classmethod
-    async def get_parameters_json_by_component_id(cls, db, component_id: int) -> dict:
-        # Component id is unique in the datatable so project_id is irrelevant
+    async def get_with_documents_by_ids(
+        cls, db, component_ids: list[int]
+    ) -> list[tuple["Component", list[Document]]]:
+        """Load components together with their current documents in two queries.
+
+        The pairs are returned in the order of component_ids, which is the order
+        in which the components are exported.
+        """
         try:
-            component = await db.get(cls, component_id)
-            if component is None:
+            components = {
+                component.id: component
+                for component in (
+                    await db.execute(select(cls).where(cls.id.in_(component_ids)))
+                ).scalars()
+            }
+            if len(components) != len(set(component_ids)):
                 raise ValueError("Component not found")
-
-            documents = await Document.get_by_component_id(db, component.id)
-            number_of_documents = len(documents)
-            component_dict = {"title": component.title, "documents": []}
-            for document in documents:
-                if document.context in ["parameters", "interface"]:
-                    component_dict["documents"].append(
-                        {
-                            "type": document.context,
-                            "document": document.json_content,
-                            "component_id": component.id,
-                        }
-                    )
+            documents = await Document.get_by_component_ids(db, list(components))
         except Exception as error:
             if type(error) is ValueError:
                 raise error
             exception = translate_exception(__name__, "get", error)
             raise exception
+        return [
+            (components[component_id], documents[component_id])
+            for component_id in component_ids
+        ]
+
+    def to_html(self, documents: list[Document]) -> str:
+        component_html = f"<h1>{self.title}</h1>"
+        for document in documents:
+            component_html += document.to_html()
+        return component_html
+
+    def to_parameters_json(self, documents: list[Document]) -> dict:
+        component_dict = {"title": self.title, "documents": []}
+        for document in documents:
+            if document.context in ["parameters", "interface"]:
+                component_dict["documents"].append(
+                    {
+                        "type": document.context,
+                        "document": document.json_content,
+                        "component_id": self.id,
+                    }
+                )
         return component_dict
 
+    @classmethod
+    async def get_html_by_id(cls, db, component_id: int) -> str:
+        # Component id is unique in the datatable so project_id is irrelevant
+        [(component, documents)] = await cls.get_with_documents_by_ids(
+            db, [component_id]
+        )
+        return component.to_html(documents)
+
+    @classmethod
+    async def get_parameters_json_by_component_id(cls, db, component_id: int) -> dict:
+        # Component id is unique in the datatable so project_id is irrelevant
+        [(component, documents)] = await cls.get_with_documents_by_ids(
+            db, [component_id]
+        )
+        return component.to_parameters_json(documents)
+
     # @classmethod
     # async def get_hierarchy(cls, db, project_id: int, component_id: int = None, level: int = 0) -> any:
     #     # Ok as on 2024-06-25 11:53
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from uuid import uuid4
+
+from sqlalchemy import Integer, String, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.services.database import BaseEntity
+from app.services.images import find_variant, variant_names
+
+
+class DocumentImage(BaseEntity):
+    """An image in app/static/document_images, stored once per content.
+
+    upload_count is the number of uploads that resolved to the image. It does
+    not tell whether documents still show the image, documents and their
+    history keep their html when they are edited or deleted, so images are
+    kept for them. release only takes back the upload of a request that
+    failed, the image is removed when no upload of it is left.
+    """
+
+    __tablename__ = "document_images"
+
+    sha256: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    file_name: Mapped[str] = mapped_column(String, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    upload_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    @classmethod
+    async def get_by_sha256(cls, db: AsyncSession, sha256: str) -> "DocumentImage":
+        return (
+            (await db.execute(select(cls).where(cls.sha256 == sha256)))
+            .scalars()
+            .first()
+        )
+
+    @classmethod
+    async def acquire(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        sha256: str,
+        size: int,
+        upload_path: str,
+        extension: str,
+    ) -> tuple["DocumentImage", bool]:
+        """Count an upload of the image with the content of the file at
+        upload_path.
+
+        A new image takes over the uploaded file under its content address,
+        for a known image the upload is removed. Returns the image and whether
+        it was new.
+        """
+        image = await cls.get_by_sha256(db, sha256)
+        if image is None:
+            image = cls(
+                sha256=sha256,
+                file_name=f"{sha256}{extension.lower()}",
+                size=size,
+                upload_count=1,
+                uuid=str(uuid4()),
+                created_by=user_id,
+                updated_by=user_id,
+            )
+            store_path = os.path.join(os.path.dirname(upload_path), image.file_name)
+            # The file is in place before the row is visible, so an upload of
+            # the same content that finds the row finds the file too
+            await asyncio.to_thread(os.replace, upload_path, store_path)
+            try:
+                db.add(image)
+                await db.commit()
+                await db.refresh(image)
+                return image, True
+            except IntegrityError:
+                # The same content was stored by a concurrent upload, which
+                # moved the same bytes to the same path
+                await db.rollback()
+                image = await cls.get_by_sha256(db, sha256)
+                upload_path = None
+
+        await db.execute(
+            update(cls)
+            .where(cls.id == image.id)
+            .values(upload_count=cls.upload_count + 1, updated_by=user_id)
+        )
+        await db.commit()
+        await db.refresh(image)
+        if upload_path is not None:
+            await asyncio.to_thread(os.remove, upload_path)
+        return image, False
+
+    @classmethod
+    async def release(
+        cls, db: AsyncSession, image_id: int, store_dir: str
+    ) -> "DocumentImage | None":
+        """Take back an upload of a request that failed, removing the image, its
+        file and its variants with the last upload."""
+        upload_count = (
+            await db.execute(
+                update(cls)
+                .where(cls.id == image_id)
+                .values(upload_count=cls.upload_count - 1)
+                .returning(cls.upload_count)
+            )
+        ).scalar()
+        if upload_count is None:
+            raise ValueError("Image not found")
+        image = await db.get(cls, image_id, populate_existing=True)
+        if upload_count > 0:
+            await db.commit()
+            return image
+
+        store_path = os.path.join(store_dir, image.file_name)
+        await db.delete(image)
+        await db.commit()
+        paths = [store_path] + list(
+            filter(None, (find_variant(store_path, name) for name in variant_names))
+        )
+        for path in paths:
+            try:
+                await asyncio.to_thread(os.remove, path)
+            except FileNotFoundError:
+                pass
+        return None
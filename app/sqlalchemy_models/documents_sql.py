@@ -5,12 +5,18 @@ from sqlalchemy import ForeignKey, Integer, String, or_, select
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Mapped, mapped_column, make_transient
+from sqlalchemy.orm import Mapped, mapped_column, make_transient, undefer_group
 
 from app.services.database import BaseEntity
 
 
 class Document(BaseEntity):
+    """A document of a component.
+
+    The html and json content can be large, it is deferred in the content
+    group and only loaded by the queries that use it.
+    """
+
     __tablename__ = "documents"
     project_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("projects.id"), nullable=False
@@ -21,12 +27,29 @@ class Document(BaseEntity):
     title: Mapped[str] = mapped_column(String(100), unique=False, nullable=False)
     sequence: Mapped[int] = mapped_column(Integer, nullable=True)
     context: Mapped[str] = mapped_column(String(100), nullable=True)
-    html_content: Mapped[str] = mapped_column(String, nullable=True)
-    json_content: Mapped[JSON] = mapped_column(JSON, nullable=True)
+    html_content: Mapped[str] = mapped_column(
+        String, nullable=True, deferred=True, deferred_group="content"
+    )
+    json_content: Mapped[JSON] = mapped_column(
+        JSON, nullable=True, deferred=True, deferred_group="content"
+    )
     interface_id: Mapped[int] = mapped_column(Integer, nullable=True)
     origin: Mapped[JSON] = mapped_column(JSON, nullable=True)
     historic_id: Mapped[int] = mapped_column(Integer, nullable=True)
 
+    @classmethod
+    async def get_with_content(
+        cls, db: AsyncSession, document_id: int
+    ) -> "Document | None":
+        """The document with its html and json content loaded, also when it is
+        already in the session without them."""
+        return await db.get(
+            cls,
+            document_id,
+            options=[undefer_group("content")],
+            populate_existing=True,
+        )
+
     @classmethod
     async def get_all(cls, db: AsyncSession) -> list["Document"]:
         documents = (await db.execute(select(cls))).scalars().all()
@@ -63,8 +86,10 @@ class Document(BaseEntity):
         )
         try:
             db.add(document)
+            await db.flush()
+            document_id = document.id
             await db.commit()
-            await db.refresh(document)
+            document = await cls.get_with_content(db, document_id)
         except IntegrityError as error:
             await db.rollback()
             raise ValueError("Document with this title already exists")
@@ -72,13 +97,15 @@ class Document(BaseEntity):
 
     @classmethod
     async def get_by_component_id(
-        cls, db: AsyncSession, component_id: int
+        cls, db: AsyncSession, component_id: int, content: bool = True
     ) -> list["Document"]:
+        query = select(cls)
+        if content:
+            query = query.options(undefer_group("content"))
         documents = (
             (
                 await db.execute(
-                    select(cls)
-                    .where(cls.historic_id == None)
+                    query.where(cls.historic_id == None)
                     .filter(
                         or_(
                             cls.component_id == component_id,
@@ -93,6 +120,37 @@ class Document(BaseEntity):
         )
         return documents
 
+    @classmethod
+    async def get_by_component_ids(
+        cls, db: AsyncSession, component_ids: list[int]
+    ) -> dict[int, list["Document"]]:
+        """Current documents of several components in one query, grouped by
+        component id. An interface document is listed under both components."""
+        documents_by_component = {component_id: [] for component_id in component_ids}
+        documents = (
+            (
+                await db.execute(
+                    select(cls)
+                    .options(undefer_group("content"))
+                    .where(cls.historic_id == None)
+                    .filter(
+                        or_(
+                            cls.component_id.in_(component_ids),
+                            cls.interface_id.in_(component_ids),
+                        )
+                    )
+                    .order_by(Document.sequence, Document.id)
+                )
+            )
+            .scalars()
+            .all()
+        )
+        for document in documents:
+            for component_id in {document.component_id, document.interface_id}:
+                if component_id in documents_by_component:
+                    documents_by_component[component_id].append(document)
+        return documents_by_component
+
     @classmethod
     async def get_by_document_id(
         cls,
@@ -100,7 +158,7 @@ class Document(BaseEntity):
         document_id: int,
     ) -> "Document":
         try:
-            document = await db.get(cls, document_id)
+            document = await cls.get_with_content(db, document_id)
             if document is None:
                 raise ValueError("Document not found")
         except ValueError as error:
@@ -118,6 +176,7 @@ class Document(BaseEntity):
                 (
                     await db.execute(
                         select(cls)
+                        .options(undefer_group("content"))
                         .where(cls.historic_id == document_id)
                         .order_by(Document.updated_at.desc())
                     )
@@ -145,9 +204,7 @@ class Document(BaseEntity):
         user_id: int | None = None,
     ) -> "Document":
         try:
-            document = (
-                (await db.execute(select(cls).filter(cls.id == id))).scalars().first()
-            )
+            document = await cls.get_with_content(db, id)
 
             if document is None:
                 raise ValueError("Document not found")
@@ -192,7 +249,7 @@ class Document(BaseEntity):
             if user_id is not None:
                 document.updated_by = user_id
             await db.commit()
-            await db.refresh(document)
+            document = await cls.get_with_content(db, id)
         except Exception as error:
             raise error
         return document
@@ -216,10 +273,13 @@ class Document(BaseEntity):
     async def get_html_by_document_id(cls, db: AsyncSession, document_id: int) -> str:
         html = ""
         try:
-            document = await db.get(cls, document_id)
+            document = await cls.get_with_content(db, document_id)
             if document is None:
                 raise ValueError("Document not found")
-            html = f"<h2>{document.title}</h2>" + (document.html_content or "")
+            html = document.to_html()
         except ValueError as error:
             raise error
         return html or ""
+
+    def to_html(self) -> str:
+        return f"<h2>{self.title}</h2>" + (self.html_content or "")
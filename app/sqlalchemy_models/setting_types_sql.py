@@ -1,12 +1,13 @@
 from uuid import uuid4
 
 from fastapi import HTTPException
-from sqlalchemy import CheckConstraint, String, select
+from sqlalchemy import CheckConstraint, Index, String, select
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.services.database import BaseEntity
+from app.services.pagination import keyset, page
 
 
 class SettingType(BaseEntity):
@@ -16,7 +17,10 @@ class SettingType(BaseEntity):
     description: Mapped[str] = mapped_column(String, nullable=True)
     default_text: Mapped[str] = mapped_column(String, nullable=True)
 
-    __table_args__ = (CheckConstraint("length(title) > 0", name="title_length"),)
+    __table_args__ = (
+        CheckConstraint("length(title) > 0", name="title_length"),
+        Index("ix_setting_types_title_id", "title", "id"),
+    )
 
     def __repr__(cls):
         return f"id:{cls.id}, title: {cls.title}"
@@ -25,6 +29,20 @@ class SettingType(BaseEntity):
     async def get_all(cls, db):
         return (await db.execute(select(cls))).scalars().all()
 
+    @classmethod
+    async def get_page(
+        cls, db: AsyncSession, limit: int | None = None, after: str | None = None
+    ) -> tuple[list["SettingType"], str | None]:
+        """A page of setting types ordered by title and the cursor of the
+        next."""
+        query = keyset(select(cls), [cls.title, cls.id], limit, after)
+        setting_types = (await db.execute(query)).scalars().all()
+        return page(
+            setting_types,
+            limit,
+            lambda setting_type: (setting_type.title, setting_type.id),
+        )
+
     @classmethod
     async def create(
         cls,
@@ -3,6 +3,7 @@ from uuid import uuid4
 from sqlalchemy import (
     CheckConstraint,
     ForeignKey,
+    Index,
     Integer,
     String,
     UniqueConstraint,
@@ -14,6 +15,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.services.database import BaseEntity
+from app.services.pagination import keyset, page
 from app.sqlalchemy_models.setting_types_sql import SettingType
 
 
@@ -30,12 +32,22 @@ class Setting(BaseEntity):
     __table_args__ = (
         UniqueConstraint(setting_type_id, title),
         CheckConstraint("length(title) > 0", name="title_length"),
+        Index("ix_settings_title_id", "title", "id"),
     )
 
     @classmethod
     async def get_all(cls, db):
         return (await db.execute(select(cls))).scalars().all()
 
+    @classmethod
+    async def get_page(
+        cls, db: AsyncSession, limit: int | None = None, after: str | None = None
+    ) -> tuple[list["Setting"], str | None]:
+        """A page of settings ordered by title and the cursor of the next."""
+        query = keyset(select(cls), [cls.title, cls.id], limit, after)
+        settings = (await db.execute(query)).scalars().all()
+        return page(settings, limit, lambda setting: (setting.title, setting.id))
+
     @classmethod
     async def create(
         cls,
@@ -6,9 +6,11 @@ from sqlalchemy import (
     Boolean,
     Column,
     ForeignKey,
+    Index,
     Integer,
     String,
     UniqueConstraint,
+    func,
     select,
 )
 from sqlalchemy.exc import IntegrityError, NoResultFound
@@ -16,7 +18,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
 
 # App imports
+from app.services.auth_cache import principal_cache
 from app.services.database import BaseEntity
+from app.services.pagination import keyset, page
 
 
 class ProjectRole(BaseEntity):
@@ -192,6 +196,7 @@ class UserSystemRole(BaseEntity):
             )
             db.add(user_system_role)
             await db.commit()
+            principal_cache.invalidate(user_id_for_role)
             await db.refresh(user_system_role)
             return user_system_role
 
@@ -327,6 +332,9 @@ class User(BaseEntity):
         back_populates="project_users",
     )
 
+    # Keyset pagination of the user listing
+    __table_args__ = (Index("ix_users_full_name_id", "full_name", "id"),)
+
     def __repr__(self):
         return f"<User {self.id}: username={self.username}, email={self.email}>"
 
@@ -349,6 +357,15 @@ class User(BaseEntity):
         users = (await db.execute(select(cls))).scalars().all()
         return users
 
+    @classmethod
+    async def get_page(
+        cls, db: AsyncSession, limit: int | None = None, after: str | None = None
+    ) -> tuple[Sequence["User"], str | None]:
+        """A page of users ordered by full name and the cursor of the next."""
+        query = keyset(select(cls), [cls.full_name, cls.id], limit, after)
+        users = (await db.execute(query)).scalars().all()
+        return page(users, limit, lambda user: (user.full_name, user.id))
+
     @classmethod
     async def create(
         cls,
@@ -493,6 +510,9 @@ class User(BaseEntity):
         except Exception:
             await db.rollback()
             raise
+        finally:
+            # Also after a failure, the first commit may have gone through
+            principal_cache.invalidate(id)
         return user
 
     @classmethod
@@ -505,6 +525,7 @@ class User(BaseEntity):
                 user.password = hashed_password
                 user.updated_by = user_id
                 await db.commit()
+                principal_cache.invalidate(id)
                 await db.refresh(user)
         except Exception:
             await db.rollback()
@@ -519,6 +540,7 @@ class User(BaseEntity):
                 raise NoResultFound
             await db.delete(user)
             await db.commit()
+            principal_cache.invalidate(id)
         except NoResultFound:
             raise ValueError("User not found")
         return {"detail": "User deleted"}
@@ -572,6 +594,7 @@ class User(BaseEntity):
             user.is_active = True
             user.updated_by = user_id
             await db.commit()
+            principal_cache.invalidate(id)
             await db.refresh(user)
         except Exception:
             await db.rollback()
@@ -585,6 +608,7 @@ class User(BaseEntity):
             user.is_active = False
             user.updated_by = user_id
             await db.commit()
+            principal_cache.invalidate(id)
             await db.refresh(user)
         except Exception:
             await db.rollback()
@@ -619,6 +643,9 @@ class Project(BaseEntity):
         secondaryjoin="and_(ProjectRole.role_id == Role.id)",
     )
 
+    # Keyset pagination of the project listing
+    __table_args__ = (Index("ix_projects_title_id", "title", "id"),)
+
     def __repr__(self):
         return f"<Project {self.id}: title={self.title}>"
 
@@ -627,6 +654,33 @@ class Project(BaseEntity):
         projects = (await db.execute(select(cls).order_by(cls.title))).scalars().all()
         return projects
 
+    @classmethod
+    async def get_page(
+        cls, db: AsyncSession, limit: int | None = None, after: str | None = None
+    ) -> tuple[Sequence["Project"], str | None]:
+        """A page of projects ordered by title and the cursor of the next."""
+        query = keyset(select(cls), [cls.title, cls.id], limit, after)
+        projects = (await db.execute(query)).scalars().all()
+        return page(projects, limit, lambda project: (project.title, project.id))
+
+    @classmethod
+    async def get_all_state(cls, db: AsyncSession) -> tuple:
+        """The number of projects and their latest updated_at, followed by the
+        same for the project roles listed with them."""
+        count, updated_at = (
+            await db.execute(select(func.count(cls.id), func.max(cls.updated_at)))
+        ).one()
+        roles_state = (
+            await db.execute(
+                select(
+                    func.count(ProjectRole.id),
+                    func.max(ProjectRole.updated_at),
+                    func.max(Role.updated_at),
+                ).join(Role, Role.id == ProjectRole.role_id)
+            )
+        ).one()
+        return count, updated_at, *roles_state
+
     @classmethod
     async def create(
         cls,
@@ -787,6 +841,7 @@ class Project(BaseEntity):
                 )
                 db.add(project_role)
             await db.commit()
+            principal_cache.clear()
             await db.refresh(project)
         except (
             IntegrityError
@@ -828,6 +883,7 @@ class Project(BaseEntity):
                 raise NoResultFound
             await db.delete(project)
             await db.commit()
+            principal_cache.clear()
         except NoResultFound:
             raise ValueError("Project not found")
         return project
@@ -858,6 +914,7 @@ class Project(BaseEntity):
             duplicate_error_check = f"DETAIL:  Key (project_id, project_role_id)=({project.id}, {project_role_id}) already exists"
             db.add(project_role)
             await db.commit()
+            principal_cache.clear()
             await db.refresh(project)
         except ValueError as error:
             await db.rollback()
@@ -990,6 +1047,7 @@ class Role(BaseEntity):
             role.updated_by = user_id
             try:
                 await db.commit()
+                principal_cache.clear()
                 await db.refresh(role)
             except IntegrityError:
                 await db.rollback()
@@ -1005,6 +1063,7 @@ class Role(BaseEntity):
             role = await cls.get(db, id)
             await db.delete(role)
             await db.commit()
+            principal_cache.clear()
         except NoResultFound:
             raise ValueError("Role not found")
         return {"detail": "Role deleted"}
@@ -1,12 +1,21 @@
+import math
+import time
 from datetime import UTC, datetime, timedelta
 from typing import Annotated
 
 import jwt
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketException,
+    status,
+)
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.security.utils import get_authorization_scheme_param
 from fastapi_camelcase import CamelModel
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
@@ -16,7 +25,9 @@ from fastapi.security.base import SecurityBase
 
 from app.config import get_config
 from app.pydantic_models.user_model import User, FullUser
+from app.services.auth_cache import principal_cache, token_cache
 from app.services.database import get_db, sessionmanager
+from app.services.passwords import PasswordServiceBusy, login_throttle, password_service
 from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
 
 config = get_config()
@@ -35,6 +46,7 @@ class Token(CamelModel):
     user_data: User
     exp: datetime
     refresh: bool
+    iat: datetime | None = None
 
 
 # TODO: When using the swagger docs interface, the frontend cannot extract the auth token
@@ -60,9 +72,6 @@ class Password(CamelModel):
     password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
 def make_token_user(user: SqlUser):
     user_model = User.model_validate(user)
     return user_model.model_dump(by_alias=True)
@@ -78,14 +87,8 @@ class Oath2SchemeUser(OAuth2PasswordBearer):
         except Exception as error:
             if error.status_code == 401 and error.detail == "Not authenticated":
                 if not config["enforce_authentication"]:
-                    async with sessionmanager.session() as db:
-                        user = await SqlUser.get(db, config["default_user_id"])
-                        user_data = make_token_user(user)
-                        params = await create_token(
-                            user_data=user_data,
-                            token_expire_minutes=access_token_expire_minutes,
-                        )
-                    return params
+                    token, _ = await get_default_principal()
+                    return token
             raise error
         return params
 
@@ -93,12 +96,12 @@ class Oath2SchemeUser(OAuth2PasswordBearer):
 oauth2_scheme = Oath2SchemeUser(tokenUrl=tokenUrl)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_service.hash(password)
 
 
-def verify_pasword(submitted_password, hashed_password):
-    return pwd_context.verify(submitted_password, hashed_password)
+async def verify_pasword(submitted_password, hashed_password):
+    return await password_service.verify(submitted_password, hashed_password)
 
 
 async def create_token(
@@ -114,6 +117,7 @@ async def create_token(
         expire = now + timedelta(minutes=token_expire_minutes)
     to_encode.update({"exp": expire})
     to_encode.update({"refresh": refresh_token})
+    to_encode.update({"iat": now})
 
     token = Token(**to_encode)
     to_encode_camel = token.model_dump(by_alias=True)
@@ -122,6 +126,41 @@ async def create_token(
     return encoded_jwt
 
 
+async def get_default_principal() -> tuple[str, SqlUser]:
+    """The token and user of the default user, who is the current user while
+    authentication is not enforced.
+
+    They are resolved once and kept in principal_cache, until the default
+    user changes or half the lifetime of the token has passed.
+    """
+    default = principal_cache.get_default()
+    if default is None:
+        generation = principal_cache.generation
+        async with sessionmanager.session() as db:
+            user = await SqlUser.get(db, config["default_user_id"])
+            token = await create_token(
+                user_data=make_token_user(user),
+                token_expire_minutes=access_token_expire_minutes,
+            )
+        renew_at = time.monotonic() + access_token_expire_minutes * 60 / 2
+        # An inactive default user is checked again by get_current_user
+        if user.is_active is not False:
+            principal_cache.set_default(token, user, renew_at, generation)
+        default = (token, user)
+    return default
+
+
+def decode_token(token: str) -> Token:
+    """The claims of a token, verified on first use and then taken from
+    token_cache until the token expires."""
+    received_token = token_cache.get(token)
+    if received_token is None:
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
+        received_token = Token(**payload)
+        token_cache.put(token, payload["exp"], received_token)
+    return received_token
+
+
 async def get_user_by_username(username: str):
     async with sessionmanager.session() as session:
         try:
@@ -144,7 +183,7 @@ async def authenticate_user_by_username(username: str, password: str):
     user = await get_user_by_username(username)
     if not user:
         raise ValueError("Incorrect username or password")
-    if not verify_pasword(password, user.password):
+    if not await verify_pasword(password, user.password):
         raise ValueError("Incorrect username or password")
     return user
 
@@ -153,7 +192,7 @@ async def authenticate_user_by_email(user_email: str, password: str):
     user = await get_user_by_email(user_email)
     if not user:
         raise ValueError("Incorrect email or password")
-    if not verify_pasword(password, user.password):
+    if not await verify_pasword(password, user.password):
         raise ValueError("Incorrect email or password")
     return user
 
@@ -164,17 +203,29 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         detail="Invalid authentication credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    default = principal_cache.get_default()
+    if (
+        default is not None
+        and token == default[0]
+        and default[1].is_active is not False
+    ):
+        return default[1]
     try:
-        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
-        received_token = Token(**payload)
+        received_token = decode_token(token)
         user_data = received_token.user_data
         ## check if token has user data
         user_email = user_data.email
         if user_email is None:
             raise credentials_exception
-        token_user = await get_user_by_email(user_email)
+        issued_at = received_token.iat
+        token_user = principal_cache.get(user_data.id, issued_at)
         if token_user is None:
-            raise credentials_exception
+            generation = principal_cache.generation
+            token_user = await get_user_by_email(user_email)
+            if token_user is None:
+                raise credentials_exception
+            if token_user.id == user_data.id:
+                principal_cache.put(user_data.id, issued_at, token_user, generation)
 
         ## check if token is expired
         # expiry_datetime = datetime.fromtimestamp(payload.get("exp"), UTC)
@@ -187,10 +238,40 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
             detail=str(error),
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if token_user.is_active is False:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Inactive user",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
     return token_user
 
 
+async def get_websocket_user(websocket: WebSocket, token: str | None = None):
+    """The current user of a websocket. Browsers can not set headers on a
+    websocket, so the token can also be passed as the token query parameter.
+    The connection is closed with a policy violation when it is missing or
+    invalid."""
+    scheme, credentials = get_authorization_scheme_param(
+        websocket.headers.get("Authorization")
+    )
+    if scheme.lower() == "bearer" and credentials:
+        token = credentials
+    if token is None:
+        if config["enforce_authentication"]:
+            raise WebSocketException(
+                code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated"
+            )
+        token, _ = await get_default_principal()
+    try:
+        return await get_current_user(token)
+    except HTTPException as error:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason=str(error.detail)
+        )
+
+
 async def get_current_user_with_roles(
     user: Annotated[SqlUser, Depends(get_current_user)],
     request: Request,
@@ -222,8 +303,7 @@ async def verify_token(request: Request):
             detail="Invalid authentication credentials",
         )
     try:
-        payload = jwt.decode(credentials, secret_key, algorithms=[algorithm])
-        received_token = Token(**payload)
+        received_token = decode_token(credentials)
         user_data = received_token.user_data
         email = user_data.email
         if email is None:
@@ -231,7 +311,7 @@ async def verify_token(request: Request):
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Invalid authentication credentials",
             )
-        expiry = datetime.fromtimestamp(payload.get("exp"), UTC)
+        expiry = received_token.exp
         if datetime.now(UTC) >= expiry:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -268,10 +348,17 @@ async def login(
     request: Request,
 ) -> CamelTokenResponse | SnakeTokenResponse:
     requester = request.headers.get("origin")
-    try:
-        user = await authenticate_user_by_email(
-            form_data.username.lower(), form_data.password
+    address = request.client.host if request.client else ""
+    username = form_data.username.lower()
+    retry_after = login_throttle.check(address, username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
         )
+    try:
+        user = await authenticate_user_by_email(username, form_data.password)
         if not user.is_active:
             raise HTTPException(status_code=401, detail="Inactive user")
         user_data = make_token_user(user)
@@ -284,12 +371,18 @@ async def login(
             token_expire_minutes=refresh_token_expire_minutes,
             refresh_token=True,
         )
+    except PasswordServiceBusy as error:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(error)
+        )
     except ValueError:
+        login_throttle.fail(address, username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_throttle.succeed(address, username)
     if requester == "http://localhost:8000":
         return SnakeTokenResponse(
             access_token=access_token, token_type="Bearer", refresh_token=refresh_token
@@ -299,6 +392,22 @@ async def login(
     )
 
 
+@router.get("/principal-cache", response_model=dict)
+async def get_principal_cache_metrics(
+    current_user: Annotated[SqlUser, Depends(get_current_user)] = None,
+) -> dict:
+    """Size and hit rate of the cache of authenticated users."""
+    return principal_cache.metrics()
+
+
+@router.get("/token-cache", response_model=dict)
+async def get_token_cache_metrics(
+    current_user: Annotated[SqlUser, Depends(get_current_user)] = None,
+) -> dict:
+    """Size and hit rate of the cache of verified tokens."""
+    return token_cache.metrics()
+
+
 @router.get("/me", response_model=FullUser)
 async def get_user_me(
     current_user: Annotated[SqlUser, Depends(get_current_active_user)],
@@ -315,10 +424,12 @@ async def set_password(
     # if config['config_name'] != 'testing':
     #     raise HTTPException(status_code=404, detail="Not found")
     try:
-        hashed_password = get_password_hash(password.password)
+        hashed_password = await get_password_hash(password.password)
         user = await SqlUser.set_password(
             db, current_user.id, current_user.id, hashed_password
         )
+    except PasswordServiceBusy as error:
+        raise HTTPException(status_code=503, detail=str(error))
     except NoResultFound:
         raise HTTPException(status_code=400, detail="User not found")
     return {"detail": "success"}
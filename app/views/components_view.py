@@ -1,8 +1,7 @@
 import os
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from pydantic_async_validation.fastapi import ensure_request_validation_errors
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
 from copy import copy as shallow_copy
@@ -22,6 +21,8 @@ from app.pydantic_models.component_model import (
 )
 from app.pydantic_models.document_model import DocumentCreate
 from app.services.database import get_db, sessionmanager
+from app.services.etags import check_not_modified
+from app.services.pagination import PageParams, set_next_cursor
 from app.sqlalchemy_models.components_sql import Component as SqlComponent
 from app.sqlalchemy_models.documents_sql import Document as SqlDocument
 
@@ -35,79 +36,62 @@ router = APIRouter(prefix="/components", tags=["components"])
 #     return components
 
 
-async def get_children(
-    db: AsyncSession,
-    component_id: int,
-    recursion_level: int = 10,
-    level: int = 0,
-    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
-) -> list[dict]:
-    children = []
-    if level < recursion_level:
-        level += 1
-        components = (
-            (
-                await db.execute(
-                    select(SqlComponent).where(SqlComponent.parent_id == component_id)
-                )
-            )
-            .scalars()
-            .all()
-        )
-        for component in components:
-            component_dict = Component.model_validate(component).model_dump()
-            component_dict["children"] = await get_children(
-                db, component.id, recursion_level, level
-            )
-            children.append(component_dict)
-    else:
-        raise ValueError("Recursion level of 10 exceeded")
-    return children
-
-
 async def get_component_hierarchy(
     component_id: int,
     levels: int = 1,
     db: AsyncSession = Depends(get_db),
 ) -> list[ComponentWithChildren]:
-    component = await SqlComponent.get_by_id(db, component_id)
-    component_dict = Component.model_validate(component).model_dump()
-    component_dict["children"] = await get_children(db, component.id, levels, 0)
-    return component_dict
+    hierarchy = await SqlComponent.get_hierarchy(
+        db, component_id=component_id, recursion_level=levels
+    )
+    return hierarchy[0]
 
 
 async def get_root_component_hierarchy(
     project_id: int,
     db: AsyncSession = Depends(get_db),
 ) -> list[ComponentWithChildren]:
-    component_list = []
-    root_components = await SqlComponent.get_root_components(db, project_id)
-    for component in root_components:
-        component_dict = Component.model_validate(component).model_dump()
-        children = await get_children(db, component.id, 10, 0)
-        component_dict["children"] = children
-        component_list.append(component_dict)
-    return component_list
+    return await SqlComponent.get_hierarchy(db, project_id=project_id)
 
 
 @router.get("", response_model=list[Component])
 async def get_components(
     project_id: int,
+    request: Request,
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> list[Component]:
     # Ok as on 2024-06-25 11:50
-    components = await SqlComponent.get_all(db, project_id)
+    state = await SqlComponent.get_state(db, project_id)
+    not_modified = check_not_modified(
+        request, response, *state, page.limit, page.after
+    )
+    if not_modified is not None:
+        return not_modified
+    try:
+        components, next_cursor = await SqlComponent.get_page(
+            db, project_id, page.limit, page.after
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    set_next_cursor(response, next_cursor)
     return components
 
 
 @router.get("/root-components", response_model=list[Component])
 async def root_components(
     project_id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> list[Component]:
     # Ok as on 2024-06-25 11:53
+    state = await SqlComponent.get_state(db, project_id)
+    if (not_modified := check_not_modified(request, response, *state)) is not None:
+        return not_modified
     root_components = await SqlComponent.get_root_components(db, project_id)
     return root_components
 
@@ -115,10 +99,15 @@ async def root_components(
 @router.get("/hierarchy", response_model=list[ComponentWithChildren])
 async def get_hierarchy(
     project_id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> list[ComponentWithChildren]:
     # Ok as on 2024-06-25 11:53
+    state = await SqlComponent.get_state(db, project_id)
+    if (not_modified := check_not_modified(request, response, *state)) is not None:
+        return not_modified
     hierarchy = await get_root_component_hierarchy(project_id, db)
     return hierarchy
 
@@ -131,7 +120,9 @@ async def get_component_by_id_with_children(
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> list[Component]:
     try:
-        children = await get_children(db, component_id)
+        # Fails with "Component not found" like the other component routes
+        await SqlComponent.get_by_id(db, component_id)
+        children = await SqlComponent.get_children(db, component_id)
     except ValueError as error:
         raise HTTPException(status_code=400, detail=str(error))
     return children
@@ -162,6 +153,8 @@ async def get_component_html_by_id(
 async def get_component(
     project_id: int,
     component_id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> Component:
@@ -169,6 +162,9 @@ async def get_component(
         component = await SqlComponent.get_by_id(db, component_id)
     except ValueError as error:
         raise HTTPException(status_code=400, detail=str(error))
+    state = (1, component.updated_at, component.id)
+    if (not_modified := check_not_modified(request, response, *state)) is not None:
+        return not_modified
     return component
 
 
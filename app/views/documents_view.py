@@ -1,19 +1,30 @@
+import asyncio
 import os
 import uuid
 from time import sleep
 from typing import List, Annotated
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from pydantic_async_validation.fastapi import ensure_request_validation_errors
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import func, select, or_
 
 from app.pydantic_models.document_model import (
     Document,
     DocumentCount,
     DocumentCreate,
+    DocumentSummaryWithUser,
     DocumentUpdate,
     DocumentWithUser,
 )
@@ -21,13 +32,25 @@ from app.pydantic_models.user_model import User
 from app.pydantic_models.component_model import ComponentCopyRecord
 
 # App imports
+from app.config import get_config
 from app.services.database import get_db
 from app.sqlalchemy_models.components_sql import Component as SqlCompoment
+from app.sqlalchemy_models.document_images_sql import (
+    DocumentImage as SqlDocumentImage,
+)
 from app.sqlalchemy_models.documents_sql import Document as SqlDocument
 from app.sqlalchemy_models.user_project_role_sql import Project as SqlProject
 from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
 from app.views.auth_view import get_current_user_with_roles
 from app.services.database import sessionmanager
+from app.services.etags import check_not_modified
+from app.services.export_executor import ExportExecutorBusy, image_executor
+from app.services.images import (
+    process_image,
+    stored_variants,
+    variant_names,
+)
+from app.services.uploads import UploadTooLarge, store_upload
 from app.services.utils import pretty_print
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -48,7 +71,9 @@ async def get_documents_count(
         component = await SqlCompoment.get_by_id(db, component_id)
         if component.project_id != project_id:
             raise ValueError("Component not found")
-        documents = await SqlDocument.get_by_component_id(db, component_id)
+        documents = await SqlDocument.get_by_component_id(
+            db, component_id, content=False
+        )
     except NoResultFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Project not found"
@@ -67,37 +92,71 @@ async def get_documents_count(
 
 
 @router.get(
-    "", response_model=list[DocumentWithUser], response_model_exclude_unset=True
+    "",
+    response_model=list[DocumentWithUser] | list[DocumentSummaryWithUser],
+    response_model_exclude_unset=True,
 )
 async def get_documents_by_component_id(
     component_id: int,
+    request: Request,
+    response: Response,
+    summary: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ):
+    """The current documents of a component, ordered by sequence.
+
+    With summary the html and json content is left out, for listings that
+    only show titles.
+    """
     try:
         # check if component exists
         await SqlCompoment.get_by_id(db, component_id)
 
-        documents = (
+        # The listed documents and the users that last updated them, aggregated
+        # to tell whether the client's copy is still current
+        count, documents_updated_at, users_updated_at = (
             await db.execute(
                 select(
-                    SqlDocument.id,
-                    SqlDocument.interface_id,
-                    SqlDocument.uuid,
-                    SqlDocument.project_id,
-                    SqlDocument.component_id,
-                    SqlDocument.title,
-                    SqlDocument.sequence,
-                    SqlDocument.context,
-                    SqlDocument.html_content,
-                    SqlDocument.json_content,
-                    SqlDocument.id,
-                    SqlDocument.uuid,
-                    SqlDocument.updated_at,
-                    SqlUser.id.label("updated_by_id"),
-                    SqlUser.full_name.label("updated_by_full_name"),
-                    SqlUser.email.label("updated_by_email"),
+                    func.count(SqlDocument.id),
+                    func.max(SqlDocument.updated_at),
+                    func.max(SqlUser.updated_at),
+                )
+                .join(SqlUser, SqlUser.id == SqlDocument.updated_by)
+                .where(
+                    or_(
+                        SqlDocument.component_id == component_id,
+                        SqlDocument.interface_id == component_id,
+                    )
                 )
+                .where(SqlDocument.historic_id == None)
+            )
+        ).one()
+        not_modified = check_not_modified(
+            request, response, count, documents_updated_at, users_updated_at, summary
+        )
+        if not_modified is not None:
+            return not_modified
+
+        columns = [
+            SqlDocument.id,
+            SqlDocument.interface_id,
+            SqlDocument.uuid,
+            SqlDocument.project_id,
+            SqlDocument.component_id,
+            SqlDocument.title,
+            SqlDocument.sequence,
+            SqlDocument.context,
+            SqlDocument.updated_at,
+            SqlUser.id.label("updated_by_id"),
+            SqlUser.full_name.label("updated_by_full_name"),
+            SqlUser.email.label("updated_by_email"),
+        ]
+        if not summary:
+            columns += [SqlDocument.html_content, SqlDocument.json_content]
+        documents = (
+            await db.execute(
+                select(*columns)
                 .join(SqlUser, SqlUser.id == SqlDocument.updated_by)
                 .where(
                     or_(
@@ -127,11 +186,20 @@ async def get_documents_by_component_id(
 @router.get("/{document_id:int}", response_model=DocumentWithUser)
 async def get_document_by_id(
     document_id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> Document:
     try:
         document = await SqlDocument.get_by_document_id(db, document_id)
+        # The response names the current user as the last editor
+        user_state = (current_user.id, current_user.updated_at)
+        not_modified = check_not_modified(
+            request, response, 1, document.updated_at, document.id, *user_state
+        )
+        if not_modified is not None:
+            return not_modified
         document_dict = document.__dict__
 
         document_dict["updated_by_id"] = current_user.id
@@ -209,23 +277,88 @@ async def update_document(
 @router.post("/upload_images")
 async def create_upload_file(
     files: List[UploadFile],
+    db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ):
+    """Stores uploaded images under /static/document_images, together with their
+    print and thumbnail variants.
+
+    Images are stored once per content, uploading an image that is already
+    stored returns the url of the stored image.
+
+    The request body is limited to upload_max_request_bytes by the
+    RequestBodyLimit middleware while Starlette reads it, before this view
+    runs. Files are limited to upload_max_file_bytes each when they are copied
+    to the store. Larger uploads are refused with a 413. Files that are not
+    images Pillow can read are refused with a 400.
+    """
+    config = get_config()
+    max_file_bytes = config.get("upload_max_file_bytes") or 20 * 1024 * 1024
+    max_request_bytes = config.get("upload_max_request_bytes") or 100 * 1024 * 1024
+
+    images_dir = os.path.join(os.getcwd(), "app", "static", "document_images")
+    variant_url = os.path.join("/", "static", "document_images", "variants")
+    images = []
     filename_list = []
-    for submitted_file in files:
-        file_uuid = uuid.uuid4()
-        name, ext = os.path.splitext(submitted_file.filename)
-        new_file_name = f"{file_uuid}{ext}"
-        cwd = os.getcwd()
-        url_path = os.path.join("/", "static", "document_images", new_file_name)
-        store_path = os.path.join(
-            cwd, "app", "static", "document_images", new_file_name
-        )
-        with open(store_path, "wb") as local_file:
-            result = local_file.write(await submitted_file.read())
-        filename_list.append(url_path)
+    variant_list = []
+    request_bytes = 0
+    try:
+        for submitted_file in files:
+            name, ext = os.path.splitext(submitted_file.filename)
+            upload_path = os.path.join(images_dir, f"{uuid.uuid4()}.upload")
+            remaining_bytes = max_request_bytes - request_bytes
+            size, sha256 = await store_upload(
+                submitted_file, upload_path, min(max_file_bytes, remaining_bytes)
+            )
+            request_bytes += size
+            image, _ = await SqlDocumentImage.acquire(
+                db, current_user.id, sha256, size, upload_path, ext
+            )
+            # Keep the values, later commits expire the image
+            images.append((image.id, image.file_name))
+
+        for _, file_name in images:
+            store_path = os.path.join(images_dir, file_name)
+            filename_list.append(
+                os.path.join("/", "static", "document_images", file_name)
+            )
+            # Duplicates of an earlier upload already have their variants
+            variants = stored_variants(store_path)
+            if len(variants) < len(variant_names):
+                variants = await image_executor.run(process_image, store_path)
+            variant_list.append(
+                {
+                    variant: os.path.join(variant_url, name)
+                    for variant, name in variants.items()
+                }
+            )
+    except Exception as error:
+        # None of the urls are returned, so the uploads are taken back
+        await db.rollback()
+        for image_id, _ in images:
+            await SqlDocumentImage.release(db, image_id, images_dir)
+        if isinstance(error, UploadTooLarge):
+            if remaining_bytes < max_file_bytes:
+                detail = f"Upload exceeds the limit of {max_request_bytes} bytes"
+            else:
+                detail = str(error)
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail
+            )
+        if isinstance(error, ExportExecutorBusy):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(error),
+                headers={"Retry-After": str(error.retry_after)},
+            )
+        if isinstance(error, ValueError):
+            # Invalid images and the like
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+            )
+        raise
 
-    return {"filenames": filename_list}
+    return {"filenames": filename_list, "variants": variant_list}
 
 
 @router.delete("/{document_id}")
@@ -0,0 +1,199 @@
+import os
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from app.pydantic_models.export_model import ExportJobResponse
+from app.pydantic_models.project_model import DocSpec
+from app.services.create_docx import (
+    render_project_docx,
+    render_project_xlsx,
+    save_export,
+)
+from app.services.downloads import (
+    content_disposition,
+    file_etag,
+    if_range_matches,
+    iter_content,
+    iter_file,
+    media_types,
+    parse_range,
+)
+from app.services.export_cache import export_cache, fragment_cache
+from app.services.export_executor import ExportExecutorBusy, export_executor
+from app.services.export_jobs import export_jobs
+from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
+from app.views.auth_view import get_current_user_with_roles
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+renderers = {
+    "docx": render_project_docx,
+    "xlsx": render_project_xlsx,
+}
+
+
+async def render_export(spec: DocSpec, persist: bool) -> tuple[dict, str | None]:
+    """Render an export, or take it from the export cache, and return it with
+    the path of its stored file, None when it is only held in memory."""
+    try:
+        export = await renderers[spec.document_type](spec)
+    except ExportExecutorBusy as error:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(error),
+            headers={"Retry-After": str(error.retry_after)},
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+    if export["cached"] is None and persist:
+        await save_export(export)
+    if export["cached"] is None and not persist:
+        return export, None
+    return export, os.path.join(
+        os.getcwd(), "app", "static", export["document_type"], export["name"]
+    )
+
+
+@router.get("/metrics", response_model=dict)
+async def get_export_metrics(
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> dict:
+    """Queue depth and throughput of the export worker pool and the hit rates of
+    the export caches."""
+    return {
+        "executor": export_executor.metrics(),
+        "cache": export_cache.metrics(),
+        "fragment_cache": fragment_cache.metrics(),
+    }
+
+
+@router.post(
+    "/jobs", response_model=ExportJobResponse, status_code=status.HTTP_202_ACCEPTED
+)
+async def create_export_job(
+    spec: DocSpec,
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> ExportJobResponse:
+    """Queues a docx or xlsx export of a project. Progress can be polled with the
+    returned job id or followed over the websocket."""
+    try:
+        job = export_jobs.submit(spec, owner_id=current_user.id)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    return job.to_response()
+
+
+@router.get("/jobs", response_model=list[ExportJobResponse])
+async def get_export_jobs(
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> list[ExportJobResponse]:
+    """Lists the export jobs of the current user."""
+    return [job.to_response() for job in export_jobs.list(owner_id=current_user.id)]
+
+
+@router.get("/jobs/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(
+    job_id: str,
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> ExportJobResponse:
+    """Gets the state and progress of an export job."""
+    try:
+        job = export_jobs.get(job_id, current_user.id)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
+    return job.to_response()
+
+
+@router.delete("/jobs/{job_id}", response_model=ExportJobResponse)
+async def cancel_export_job(
+    job_id: str,
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> ExportJobResponse:
+    """Cancels a queued or running export job."""
+    try:
+        export_jobs.get(job_id, current_user.id)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
+    try:
+        job = await export_jobs.cancel(job_id, current_user.id)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+    return job.to_response()
+
+
+@router.post("/download")
+async def download_export(
+    spec: DocSpec,
+    persist: bool = False,
+    range: Annotated[str | None, Header()] = None,
+    if_range: Annotated[str | None, Header()] = None,
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> StreamingResponse:
+    """Renders a docx or xlsx export of a project and streams it back.
+
+    Unchanged exports are streamed from the export cache. Otherwise the export
+    is streamed from memory and only stored under /static when persist is set.
+
+    A single byte range can be requested with the Range header, and If-Range
+    with the ETag of the response, for stored exports only. An export that is
+    rendered again does not give the same bytes, a docx holds the time it was
+    written, so the ranges of different renders would not fit together.
+    """
+    if spec.document_type not in renderers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown document type {spec.document_type}",
+        )
+    export, path = await render_export(spec, persist)
+    stat = None
+    if path is not None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # The cached file was evicted or deleted since the cache lookup
+            export_cache.discard(export["cache_key"])
+            export, path = await render_export(spec, persist)
+            if path is not None:
+                stat = os.stat(path)
+
+    headers = {"Content-Disposition": content_disposition(export["name"])}
+    byte_range = None
+    if stat is not None:
+        size = stat.st_size
+        headers["Accept-Ranges"] = "bytes"
+        headers["ETag"] = file_etag(stat)
+        if if_range_matches(if_range, headers["ETag"]):
+            try:
+                byte_range = parse_range(range, size)
+            except ValueError as error:
+                raise HTTPException(
+                    status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    detail=str(error),
+                    headers={"Content-Range": f"bytes */{size}"},
+                )
+    else:
+        size = len(export["content"])
+        headers["Accept-Ranges"] = "none"
+
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    body = (
+        iter_file(path, start, end)
+        if stat is not None
+        else iter_content(export["content"], start, end)
+    )
+    return StreamingResponse(
+        body,
+        status_code=(
+            status.HTTP_206_PARTIAL_CONTENT
+            if byte_range is not None
+            else status.HTTP_200_OK
+        ),
+        media_type=media_types[export["document_type"]],
+        headers=headers,
+    )
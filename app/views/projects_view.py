@@ -1,7 +1,7 @@
 # Standard libary imports
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.pydantic_models.project_model import (
@@ -16,8 +16,12 @@ from app.pydantic_models.project_model import (
 # App imports
 from app.pydantic_models.role_model import Role
 from app.pydantic_models.project_model import Project
+from app.services.auth_cache import principal_cache
+from app.services.component_cache import component_cache
 from app.services.create_docx import create_project_docx, create_project_xlsx
 from app.services.database import get_db
+from app.services.etags import check_not_modified
+from app.services.pagination import PageParams, set_next_cursor
 from app.sqlalchemy_models.user_project_role_sql import (
     Project as SqlProject,
     User as SqlUser,
@@ -42,13 +46,35 @@ async def get_current_user_projects(
     return user["projects"]
 
 
+@router.get("/component-cache", response_model=dict)
+async def get_component_cache_metrics(
+    current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
+) -> dict:
+    """Size and hit rate of the cache of project components."""
+    return component_cache.metrics()
+
+
 @router.get("", response_model=list[ProjectWithProjectRoles])
 async def get_all_projects(
+    request: Request,
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ):
-    """Provides a list of all projects in the system."""
-    projects = await SqlProject.get_all(db)
+    """Provides a list of all projects in the system ordered by title, a page
+    of limit projects after the cursor when a limit is given."""
+    state = await SqlProject.get_all_state(db)
+    not_modified = check_not_modified(
+        request, response, *state, page.limit, page.after
+    )
+    if not_modified is not None:
+        return not_modified
+    try:
+        projects, next_cursor = await SqlProject.get_page(db, page.limit, page.after)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    set_next_cursor(response, next_cursor)
     return projects
 
 
@@ -73,6 +99,7 @@ async def create_project(
         )
         db.add(association)
         await db.commit()
+        principal_cache.invalidate(current_user.id)
         await db.refresh(association)
         await db.refresh(project)
 
@@ -105,6 +132,8 @@ async def create_project(
 @router.get("/{id:int}", response_model=Project)
 async def get_project_by_param_id(
     id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ) -> Project:
@@ -113,6 +142,9 @@ async def get_project_by_param_id(
         project = await SqlProject.get_project_by_id(db, id)
     except ValueError as error:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
+    state = (1, project.updated_at, project.id)
+    if (not_modified := check_not_modified(request, response, *state)) is not None:
+        return not_modified
     return project
 
 
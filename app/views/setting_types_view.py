@@ -1,6 +1,6 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.pydantic_models.setting_type_model import (
@@ -9,6 +9,7 @@ from app.pydantic_models.setting_type_model import (
     SettingTypeUpdate,
 )
 from app.services.database import get_db
+from app.services.pagination import PageParams, set_next_cursor
 from app.sqlalchemy_models.setting_types_sql import SettingType as SqlSettingType
 from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
 from app.views.auth_view import get_current_user_with_roles
@@ -18,10 +19,18 @@ router = APIRouter(prefix="/setting-types", tags=["setting-types"])
 
 @router.get("", response_model=list[SettingType])
 async def get_setting_types(
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ):
-    setting_types = await SqlSettingType.get_all(db)
+    try:
+        setting_types, next_cursor = await SqlSettingType.get_page(
+            db, page.limit, page.after
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    set_next_cursor(response, next_cursor)
     return setting_types
 
 
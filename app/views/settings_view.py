@@ -1,10 +1,11 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.pydantic_models.setting_model import Setting, SettingCreate, SettingUpdate
 from app.services.database import get_db
+from app.services.pagination import PageParams, set_next_cursor
 from app.sqlalchemy_models.settings_sql import Setting as SqlSetting
 from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
 from app.views.auth_view import get_current_user_with_roles
@@ -15,10 +16,16 @@ router = APIRouter(prefix="/settings", tags=["settings"])
 
 @router.get("", response_model=list[Setting])
 async def get_settings(
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ):
-    settings = await SqlSetting.get_all(db)
+    try:
+        settings, next_cursor = await SqlSetting.get_page(db, page.limit, page.after)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    set_next_cursor(response, next_cursor)
     return settings
 
 
@@ -1,9 +1,9 @@
 from typing import Annotated, Any, List, Sequence
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import noload, selectinload
 from sqlalchemy import and_, select
 from rich import print
 
@@ -22,7 +22,10 @@ from app.pydantic_models.project_model import (
     Project,
     ProjectWithProjectRoles,
 )
+from app.pydantic_models.role_model import Role, SimpleRole
+from app.services.auth_cache import principal_cache
 from app.services.database import get_db
+from app.services.pagination import PageParams, set_next_cursor
 
 
 from app.sqlalchemy_models.user_project_role_sql import (
@@ -46,83 +49,124 @@ router = APIRouter(
 )
 
 
-async def get_user_project_role_ids(db, project_id: int, user_id: int) -> List[int]:
-    user_project_roles = (
+async def construct_users(db, user_ids: List[int]) -> List[dict]:
+    """The users with their projects, their roles in each project and their
+    system roles, in the order of user_ids.
+
+    Everything is read in four queries, however many users and projects
+    there are, and put together in memory. The relationships of the loaded
+    rows are not loaded, they are filled in from the other queries.
+    """
+    users = (
         (
             await db.execute(
-                select(
-                    SqlUserProjectRole.project_role_id.label("user_project_role_id"),
-                    SqlProjectRole.project_id,
-                    SqlProjectRole.role_id,
-                )
-                .join(
-                    SqlProjectRole,
-                    SqlUserProjectRole.project_role_id == SqlProjectRole.id,
-                )
-                .where(
-                    SqlUserProjectRole.user_id == user_id,
-                    SqlProjectRole.project_id == project_id,
-                )
+                select(SqlUser).where(SqlUser.id.in_(user_ids)).options(noload("*"))
             )
         )
-        .mappings()
+        .scalars()
         .all()
     )
-    records = [role["role_id"] for role in user_project_roles]
-    return records
-
-
-async def construct_user(db, user_id: int):
-    """Helper function to get a user by ID."""
-    # user = await SqlUser.get(db, user_id)
-    user = (
-        (
-            await db.execute(
-                select(SqlUser)
-                .filter(SqlUser.id == user_id)
-                .options(
-                    selectinload(SqlUser.projects),
-                    selectinload(SqlUser.project_roles),
-                    selectinload(SqlUser.system_roles),
-                )
+    memberships = (
+        await db.execute(
+            select(SqlUserProject.user_id, SqlProject)
+            .join(SqlProject, SqlProject.id == SqlUserProject.project_id)
+            .where(SqlUserProject.user_id.in_(user_ids))
+            .order_by(SqlProject.id)
+            .options(noload("*"))
+        )
+    ).all()
+    project_roles = (
+        await db.execute(
+            select(SqlUserProjectRole.user_id, SqlProjectRole.project_id, SqlRole)
+            .join(
+                SqlProjectRole, SqlUserProjectRole.project_role_id == SqlProjectRole.id
             )
+            .join(SqlRole, SqlRole.id == SqlProjectRole.role_id)
+            .where(SqlUserProjectRole.user_id.in_(user_ids))
+            .order_by(SqlRole.id)
+            .options(noload("*"))
         )
-        .scalars()
-        .first()
-    )
-    # from_attributes=True is needed to allow the model to be created from the SQLAlchemy model
-    # and follow all the attributes recursively, other wise it only validates the top level attributes
-    # and gives an error for the nested attribute
-    pydantic_user = UserWithProjectsAndSystemRoles.model_validate(
-        user, from_attributes=True
-    )
-
-    user_dict = pydantic_user.model_dump()
-    user_projects = user_dict.get("projects", [])
-    for project in user_projects:
-        user_role_ids = await get_user_project_role_ids(
-            db, project_id=project["id"], user_id=user_id
+    ).all()
+    system_roles = (
+        await db.execute(
+            select(SqlUserSystemRole.user_id, SqlRole)
+            .join(SqlRole, SqlRole.id == SqlUserSystemRole.system_role_id)
+            .where(SqlUserSystemRole.user_id.in_(user_ids))
+            .order_by(SqlRole.id)
+            .options(noload("*"))
         )
-        project["project_roles"] = [
-            role for role in project["project_roles"] if role["id"] in user_role_ids
+    ).all()
+
+    # Every project and role is validated once, however many users share it
+    projects = {}
+    projects_by_user = {user_id: [] for user_id in user_ids}
+    for user_id, project in memberships:
+        if project.id not in projects:
+            projects[project.id] = ProjectWithProjectRoles.model_validate(
+                project, from_attributes=True
+            ).model_dump(exclude={"project_roles"})
+        projects_by_user[user_id].append(project.id)
+    roles = {}
+    roles_by_user_project = {}
+    for user_id, project_id, role in project_roles:
+        if role.id not in roles:
+            roles[role.id] = Role.model_validate(role).model_dump()
+        roles_by_user_project.setdefault((user_id, project_id), []).append(role.id)
+    system_roles_by_user = {user_id: [] for user_id in user_ids}
+    for user_id, role in system_roles:
+        system_roles_by_user[user_id].append(
+            SimpleRole.model_validate(role, from_attributes=True).model_dump()
+        )
+
+    users_by_id = {user.id: user for user in users}
+    users_to_return = []
+    for user_id in user_ids:
+        user = users_by_id.get(user_id)
+        if user is None:
+            continue
+        # from_attributes=True reads the attributes of the SQLAlchemy model,
+        # the relationships are left empty by noload and filled in here
+        user_dict = UserWithProjectsAndSystemRoles.model_validate(
+            user, from_attributes=True
+        ).model_dump()
+        user_dict["projects"] = [
+            {
+                **projects[project_id],
+                "project_roles": [
+                    roles[role_id]
+                    for role_id in roles_by_user_project.get((user_id, project_id), [])
+                ],
+            }
+            for project_id in projects_by_user[user_id]
         ]
+        user_dict["system_roles"] = system_roles_by_user[user_id]
+        users_to_return.append(user_dict)
+    return users_to_return
+
 
-    if not user:
+async def construct_user(db, user_id: int):
+    """Helper function to get a user by ID."""
+    users = await construct_users(db, [user_id])
+    if not users:
         raise HTTPException(status_code=404, detail="User not found")
-    return user_dict
+    return users[0]
 
 
 @router.get("", response_model=Sequence[UserWithProjectsAndSystemRoles])
 async def get_users(
+    response: Response,
+    page: Annotated[PageParams, Depends()],
     db: AsyncSession = Depends(get_db),
     current_user: Annotated[SqlUser, Depends(get_current_user_with_roles)] = None,
 ):
-    """Get all users in the system."""
-    users = await SqlUser.get_all(db)
-    users_to_return = []
-    for user in users:
-        users_to_return.append(await construct_user(db, user.id))
-    return users_to_return
+    """Get the users in the system ordered by full name, a page of limit users
+    after the cursor when a limit is given."""
+    try:
+        users, next_cursor = await SqlUser.get_page(db, page.limit, page.after)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    set_next_cursor(response, next_cursor)
+    return await construct_users(db, [user.id for user in users])
 
 
 @router.post(
@@ -271,6 +315,7 @@ async def set_user_projects(
         for association in associations:
             await db.delete(association[0])
         await db.commit()
+        principal_cache.invalidate(id)
         await db.refresh(user)
 
         for project_id in project_ids:
@@ -283,6 +328,7 @@ async def set_user_projects(
             )
             db.add(association)
             await db.commit()
+            principal_cache.invalidate(id)
             await db.refresh(user)
         await db.flush()
         user_for_return = await construct_user(db, id)
@@ -387,6 +433,7 @@ async def set_user_project_role(
     )
     db.add(new_user_project_role)
     await db.commit()
+    principal_cache.invalidate(user_id)
     await db.refresh(user)
     return new_user_project_role
 
@@ -441,6 +488,7 @@ async def remove_user_project_role(
 
         await db.delete(user_project_role)
         await db.commit()
+        principal_cache.invalidate(user_id)
         return user_project_role
     except Exception:
         raise
@@ -632,6 +680,7 @@ async def remove_system_role_for_user(
             raise ValueError("System role not found for this user")
         await db.delete(system_role)
         await db.commit()
+        principal_cache.invalidate(user_id)
     except ValueError as error:
         raise HTTPException(status_code=400, detail=str(error))
     return await construct_user(db, user_id)
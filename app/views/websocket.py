@@ -2,47 +2,56 @@ import json
 from typing import Annotated
 
 from fastapi import APIRouter, WebSocket, Depends
+from pydantic import ValidationError
 from starlette.websockets import WebSocketDisconnect
 
+from app.pydantic_models.export_model import ExportProgressEvent
 from app.pydantic_models.project_model import DocSpec
 from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
-from app.views.auth_view import get_current_user_with_roles
-from app.services.create_docx import create_project_docx, create_project_xlsx
+from app.views.auth_view import get_websocket_user
+from app.services.export_jobs import export_jobs
 
 router = APIRouter(prefix="/ws", tags=["websocket"])
 
-valid_types = ["create_document"]
+valid_types = ["create_document", "subscribe", "cancel"]
 
 
-async def process_data(websocket, message):
+async def send_error(websocket, error):
+    await websocket.send_text(json.dumps({"error": str(error)}))
+
+
+async def process_data(websocket, message, user: SqlUser):
     try:
         json_message = json.loads(message)
         message_type = json_message.get("type")
-        document_type = json_message.get("documentType")
         if message_type is None:
-            await websocket.send_text(str({"error": "No message type provided"}))
+            await send_error(websocket, "No message type provided")
             return
         if message_type not in valid_types:
-            await websocket.send_text(str({"error": "Unknown message type"}))
+            await send_error(websocket, "Unknown message type")
             return
         if message_type == "create_document":
-
             doc_spec = DocSpec.model_validate_json(message)
-            document_meta = None
-            if document_type == "docx":
-                document_meta = await create_project_docx(doc_spec)
-            elif document_type == "xlsx":
-                document_meta = await create_project_xlsx(doc_spec)
-            await websocket.send_text(str(document_meta))
-            return
-    except json.JSONDecodeError as error:
-        await websocket.send_text(str({"error": error}))
-        return
+            job = export_jobs.submit(
+                doc_spec, owner_id=user.id, listener=websocket.send_text
+            )
+        elif message_type == "subscribe":
+            job = export_jobs.subscribe(
+                json_message.get("jobId"), user.id, websocket.send_text
+            )
+        elif message_type == "cancel":
+            job = await export_jobs.cancel(json_message.get("jobId"), user.id)
+        await websocket.send_text(
+            ExportProgressEvent(job=job.to_response()).model_dump_json(by_alias=True)
+        )
+    except (json.JSONDecodeError, ValidationError, ValueError) as error:
+        await send_error(websocket, error)
 
 
 @router.websocket("")
 async def websocket_endpoint(
     websocket: WebSocket,
+    current_user: Annotated[SqlUser, Depends(get_websocket_user)],
 ):
 
     await websocket.accept()
@@ -52,7 +61,9 @@ async def websocket_endpoint(
             if data == "close":
                 await websocket.close(1000, "Server closed socket")
                 break
-            await process_data(websocket, data)
+            await process_data(websocket, data, current_user)
 
     except WebSocketDisconnect:
         pass
+    finally:
+        export_jobs.unsubscribe(websocket.send_text)
@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+from app.services.pagination import encode_cursor
+from tests.utils import get_all_pages
+
+
+@pytest.mark.asyncio
+async def test_users_pages_add_up_to_the_full_listing(client):
+    response = await client.get("/users")
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    users = response.json()
+    assert [user["fullName"] for user in users] == sorted(
+        user["fullName"] for user in users
+    )
+
+    for limit in (1, 2):
+        paged_users, pages = await get_all_pages(client, "/users", limit)
+        assert paged_users == users
+        assert pages == max(math.ceil(len(users) / limit), 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        encode_cursor(("First Test User",)),
+        encode_cursor(("a", "b")),
+        encode_cursor((1, 2)),
+        encode_cursor(("First Test User", True)),
+        encode_cursor(("First Test User", 2**64)),
+    ],
+)
+async def test_users_invalid_cursor(client, cursor):
+    response = await client.get("/users", params={"limit": 1, "after": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.asyncio
+async def test_users_limit_out_of_range(client):
+    for limit in (0, 1001):
+        response = await client.get("/users", params={"limit": limit})
+        assert response.status_code == 422
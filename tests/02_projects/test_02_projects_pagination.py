@@ -0,0 +1,29 @@
+import math
+
+import pytest
+
+from app.services.pagination import encode_cursor
+from tests.utils import get_all_pages
+
+
+@pytest.mark.asyncio
+async def test_projects_pages_add_up_to_the_full_listing(client):
+    response = await client.get("/projects")
+    assert response.status_code == 200
+    projects = response.json()
+
+    for limit in (1, 2):
+        paged_projects, pages = await get_all_pages(client, "/projects", limit)
+        assert paged_projects == projects
+        assert pages == max(math.ceil(len(projects) / limit), 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "cursor",
+    ["not a cursor", encode_cursor(("Project 1",)), encode_cursor(("a", "b"))],
+)
+async def test_projects_invalid_cursor(client, cursor):
+    response = await client.get("/projects", params={"limit": 1, "after": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
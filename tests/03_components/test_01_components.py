@@ -1,7 +1,9 @@
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
+from sqlalchemy import update
 
+from app.sqlalchemy_models.components_sql import Component as SqlComponent
 from tests.utils import print_response, remove_uuid
 
 
@@ -787,6 +789,23 @@ async def test_root_components_of_project(client, get_projects):
     ]
 
 
+@pytest.mark.asyncio
+async def test_component_hierarchy_of_project(client, get_projects):
+    # project_a - comp(id:1, lvl:0) - comp(id:3, lvl:1)
+    #                               + comp(id:4, lvl:1)
+    #           + comp(id:2, lvl:0)
+    # project_b
+    project_id = get_projects["project_a"]["id"]
+    response = await client.get(f"/projects/{project_id}/components/hierarchy")
+    assert response.status_code == 200
+
+    hierarchy = [
+        (component["id"], [child["id"] for child in component["children"]])
+        for component in response.json()
+    ]
+    assert hierarchy == [(1, [3, 4]), (2, [])]
+
+
 @pytest.mark.asyncio
 async def test_create_level_3_component_with_level_0_parent_id(
     client, get_projects, get_component
@@ -1176,3 +1195,34 @@ async def test_delete_component_without_descendants(
         "sequence": 1,
         "title": "Component 1.4.1",
     }
+
+
+@pytest.mark.asyncio
+async def test_components_changed_in_the_database_are_not_served_from_cache(
+    client, db, get_projects
+):
+    # Another process changes a component without going through the cache
+    project_id = get_projects["project_a"]["id"]
+    url = f"/projects/{project_id}/components"
+    response = await client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    title = next(c["title"] for c in response.json() if c["id"] == 2)
+
+    await db.execute(
+        update(SqlComponent)
+        .where(SqlComponent.id == 2)
+        .values(title="Changed elsewhere")
+    )
+    await db.commit()
+    try:
+        response = await client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        changed = next(c for c in response.json() if c["id"] == 2)
+        assert changed["title"] == "Changed elsewhere"
+    finally:
+        await db.execute(
+            update(SqlComponent).where(SqlComponent.id == 2).values(title=title)
+        )
+        await db.commit()
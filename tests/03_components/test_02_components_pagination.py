@@ -0,0 +1,41 @@
+import math
+
+import pytest
+
+from app.services.pagination import encode_cursor
+from tests.utils import get_all_pages
+
+
+@pytest.mark.asyncio
+async def test_components_pages_add_up_to_the_full_listing(client):
+    projects = (await client.get("/projects")).json()
+    for project in projects:
+        url = f"/projects/{project['id']}/components"
+        response = await client.get(url)
+        assert response.status_code == 200
+        components = response.json()
+
+        for limit in (1, 2):
+            paged_components, pages = await get_all_pages(client, url, limit)
+            assert paged_components == components
+            assert pages == max(math.ceil(len(components) / limit), 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        encode_cursor((1,)),
+        encode_cursor(("a", "b")),
+        encode_cursor((1.5, 1)),
+        encode_cursor((None, 1)),
+    ],
+)
+async def test_components_invalid_cursor(client, cursor):
+    project_id = (await client.get("/projects")).json()[0]["id"]
+    response = await client.get(
+        f"/projects/{project_id}/components", params={"limit": 1, "after": cursor}
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
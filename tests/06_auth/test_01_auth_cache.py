@@ -0,0 +1,176 @@
+import time
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from app.services import auth_cache
+from app.services.auth_cache import PrincipalCache, TokenCache, principal_cache
+from app.sqlalchemy_models.user_project_role_sql import User as SqlUser
+
+issued_at = datetime(2024, 1, 1, tzinfo=UTC)
+later = issued_at + timedelta(minutes=1)
+
+
+@pytest.fixture
+def cache():
+    cache = PrincipalCache()
+    cache.init(ttl=30, max_entries=10)
+    return cache
+
+
+def test_principal_cache_hit(cache):
+    user = SimpleNamespace(id=1)
+    cache.put(1, issued_at, user, cache.generation)
+    assert cache.get(1, issued_at) is user
+    assert cache.get(1, later) is None
+    assert cache.metrics()["hits"] == 1
+    assert cache.metrics()["misses"] == 1
+
+
+def test_principal_cache_invalidate_drops_the_user_and_default(cache):
+    user_1, user_2 = SimpleNamespace(id=1), SimpleNamespace(id=2)
+    cache.put(1, issued_at, user_1, cache.generation)
+    cache.put(1, later, user_1, cache.generation)
+    cache.put(2, issued_at, user_2, cache.generation)
+    cache.set_default("token", user_1, time.monotonic() + 60, cache.generation)
+    assert cache.get_default() == ("token", user_1)
+
+    cache.invalidate(1)
+
+    assert cache.get(1, issued_at) is None
+    assert cache.get(1, later) is None
+    assert cache.get(2, issued_at) is user_2
+    assert cache.get_default() is None
+
+
+def test_principal_cache_ignores_a_put_that_raced_an_invalidation(cache):
+    user = SimpleNamespace(id=1)
+    # The user was loaded before it changed, and is stored after
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put(1, issued_at, user, generation)
+    cache.set_default("token", user, time.monotonic() + 60, generation)
+
+    assert cache.get(1, issued_at) is None
+    assert cache.get_default() is None
+
+
+def test_principal_cache_clear_drops_every_user(cache):
+    cache.put(1, issued_at, SimpleNamespace(id=1), cache.generation)
+    cache.put(2, issued_at, SimpleNamespace(id=2), cache.generation)
+    generation = cache.generation
+    cache.clear()
+    cache.put(3, issued_at, SimpleNamespace(id=3), generation)
+    assert cache.metrics()["entries"] == 0
+
+
+def test_principal_cache_entries_expire(cache, monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(auth_cache.time, "monotonic", lambda: now)
+    user = SimpleNamespace(id=1)
+    cache.put(1, issued_at, user, cache.generation)
+    cache.set_default("token", user, now + 10, cache.generation)
+
+    monkeypatch.setattr(auth_cache.time, "monotonic", lambda: now + 10)
+    assert cache.get(1, issued_at) is user
+    # The default principal is renewed when its time has come
+    assert cache.get_default() is None
+
+    monkeypatch.setattr(auth_cache.time, "monotonic", lambda: now + 31)
+    assert cache.get(1, issued_at) is None
+
+
+def test_principal_cache_is_bounded(cache):
+    cache.init(ttl=30, max_entries=2)
+    for user_id in (1, 2, 3):
+        cache.put(user_id, issued_at, SimpleNamespace(id=user_id), cache.generation)
+    assert cache.get(1, issued_at) is None
+    assert cache.get(3, issued_at) is not None
+
+
+def test_principal_cache_ttl_0_disables_it(cache):
+    cache.init(ttl=0)
+    cache.put(1, issued_at, SimpleNamespace(id=1), cache.generation)
+    assert cache.get(1, issued_at) is None
+
+
+def test_token_cache_keeps_claims_until_the_token_expires(monkeypatch):
+    cache = TokenCache()
+    cache.init(max_entries=2)
+    now = time.time()
+    monkeypatch.setattr(auth_cache.time, "time", lambda: now)
+    cache.put("a", now + 60, "claims a")
+    cache.put("b", now + 60, "claims b")
+    assert cache.get("a") == "claims a"
+
+    # b is the least recently used
+    cache.put("c", now + 60, "claims c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "claims a"
+
+    monkeypatch.setattr(auth_cache.time, "time", lambda: now + 60)
+    assert cache.get("a") is None
+    assert cache.metrics()["entries"] == 1
+
+
+def test_decode_token_raises_for_an_expired_cached_token(monkeypatch):
+    from app.views.auth_view import Token, algorithm, decode_token, secret_key
+
+    token_cache = TokenCache()
+    token_cache.init()
+    monkeypatch.setattr("app.views.auth_view.token_cache", token_cache)
+    now = datetime.now(UTC)
+    payload = {
+        "userData": {
+            "id": 1,
+            "uuid": "expired",
+            "email": "expired@example.com",
+            "fullName": "Expired User",
+        },
+        "exp": now - timedelta(seconds=1),
+        "refresh": False,
+        "iat": now - timedelta(minutes=30),
+    }
+    token = jwt.encode(payload, secret_key, algorithm=algorithm)
+    # Verified while it was valid
+    token_cache.put(token, payload["exp"].timestamp(), Token(**payload))
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_token(token)
+    assert token_cache.metrics()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_deactivated_user_is_refused_at_once(db):
+    from app.views.auth_view import create_token, get_current_user, make_token_user
+
+    user = await SqlUser.create(
+        db, 1, "Cached User", None, "cached.user@example.com"
+    )
+    token = await create_token(make_token_user(user), 30)
+    assert (await get_current_user(token)).id == user.id
+    assert principal_cache.metrics()["entries"] > 0
+
+    await SqlUser.update(
+        db, 1, user.id, None, None, None, None, is_active=False, is_superuser=None
+    )
+
+    with pytest.raises(HTTPException) as error:
+        await get_current_user(token)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_inactive_default_principal_is_refused(cache, monkeypatch):
+    from app.views.auth_view import get_current_user
+
+    monkeypatch.setattr("app.views.auth_view.principal_cache", cache)
+    user = SimpleNamespace(id=1, is_active=False)
+    cache.set_default("token", user, time.monotonic() + 60, cache.generation)
+
+    with pytest.raises(HTTPException) as error:
+        await get_current_user("token")
+    assert error.value.status_code == 401
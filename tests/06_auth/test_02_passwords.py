@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from app.services import passwords
+from app.services.passwords import LoginThrottle, PasswordService, PasswordServiceBusy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(passwords.time, "monotonic", lambda: clock[0])
+    return clock
+
+
+@pytest.fixture
+def throttle():
+    throttle = LoginThrottle()
+    throttle.init(max_attempts=3, window=60, max_addresses=10)
+    return throttle
+
+
+@pytest.mark.asyncio
+async def test_password_service_hash_and_verify():
+    service = PasswordService()
+    service.init(max_workers=1, max_queued=1)
+    try:
+        hashed = await service.hash("secret")
+        assert await service.verify("secret", hashed)
+        assert not await service.verify("wrong", hashed)
+        assert not await service.verify("secret", None)
+        assert service.metrics()["completed"] == 4
+    finally:
+        service.close()
+
+
+@pytest.mark.asyncio
+async def test_password_service_refuses_when_the_queue_is_full():
+    service = PasswordService()
+    service.init(max_workers=1, max_queued=1)
+    try:
+        running = asyncio.create_task(service.hash("first"))
+        waiting = asyncio.create_task(service.hash("second"))
+        await asyncio.sleep(0)
+        assert service.metrics()["running"] == 1
+        assert service.metrics()["queued"] == 1
+
+        with pytest.raises(PasswordServiceBusy):
+            await service.hash("third")
+        assert service.metrics()["refused"] == 1
+
+        await asyncio.gather(running, waiting)
+        assert service.metrics()["queued"] == 0
+        assert service.metrics()["running"] == 0
+    finally:
+        service.close()
+
+
+def test_login_throttle_refuses_after_max_failed_attempts(throttle, clock):
+    for _ in range(3):
+        assert throttle.check("10.0.0.1", "user@example.com") == 0
+        throttle.fail("10.0.0.1", "user@example.com")
+        clock[0] += 10
+
+    assert throttle.check("10.0.0.1", "user@example.com") == 30
+    assert throttle.metrics()["throttled"] == 1
+
+
+def test_login_throttle_window_expires(throttle, clock):
+    for _ in range(3):
+        throttle.fail("10.0.0.1", "user@example.com")
+    assert throttle.check("10.0.0.1", "user@example.com") == 60
+
+    clock[0] += 60
+    assert throttle.check("10.0.0.1", "user@example.com") == 0
+
+
+def test_login_throttle_keys_on_address_and_username(throttle, clock):
+    for _ in range(3):
+        throttle.fail("10.0.0.1", "user@example.com")
+
+    assert throttle.check("10.0.0.1", "other@example.com") == 0
+    assert throttle.check("10.0.0.2", "user@example.com") == 0
+
+
+def test_login_throttle_success_forgets_failed_attempts(throttle, clock):
+    for _ in range(2):
+        throttle.fail("10.0.0.1", "user@example.com")
+    throttle.succeed("10.0.0.1", "user@example.com")
+    for _ in range(2):
+        throttle.fail("10.0.0.1", "user@example.com")
+
+    assert throttle.check("10.0.0.1", "user@example.com") == 0
+
+
+def test_login_throttle_forgets_old_keys(throttle, clock):
+    for number in range(10):
+        throttle.fail("10.0.0.1", f"user{number}@example.com")
+    assert throttle.metrics()["keys"] == 10
+
+    clock[0] += 60
+    throttle.fail("10.0.0.1", "user@example.com")
+    assert throttle.metrics()["keys"] == 1
+
+
+def test_login_throttle_disabled(clock):
+    throttle = LoginThrottle()
+    throttle.init(max_attempts=0)
+    for _ in range(100):
+        throttle.fail("10.0.0.1", "user@example.com")
+
+    assert throttle.check("10.0.0.1", "user@example.com") == 0
+
+
+def test_login_throttle_limits_the_attempts_of_an_address(clock):
+    throttle = LoginThrottle()
+    throttle.init(max_attempts=3, window=60, max_address_attempts=5)
+    for number in range(5):
+        assert throttle.check("10.0.0.1", f"user{number}@example.com") == 0
+        throttle.fail("10.0.0.1", f"user{number}@example.com")
+
+    assert throttle.check("10.0.0.1", "user5@example.com") == 60
+    assert throttle.check("10.0.0.2", "user5@example.com") == 0
+
+
+def test_login_throttle_evicts_the_oldest_keys_within_the_window(throttle, clock):
+    for number in range(25):
+        throttle.check(f"10.0.0.{number}", f"user{number}@example.com")
+        throttle.fail(f"10.0.0.{number}", f"user{number}@example.com")
+        clock[0] += 1
+
+    assert throttle.metrics()["addresses"] == 10
+    assert throttle.metrics()["keys"] == 10
+    for _ in range(2):
+        throttle.fail("10.0.0.24", "user24@example.com")
+    assert throttle.check("10.0.0.24", "user24@example.com") > 0
+
+
+@pytest.mark.asyncio
+async def test_login_refuses_many_usernames_from_one_address(client, monkeypatch):
+    from app.views import auth_view
+
+    throttle = LoginThrottle()
+    throttle.init(max_attempts=3, window=60, max_address_attempts=5)
+    monkeypatch.setattr(auth_view, "login_throttle", throttle)
+
+    statuses = []
+    for number in range(6):
+        response = await client.post(
+            "/auth/token",
+            data={"username": f"nobody{number}@example.com", "password": "wrong"},
+        )
+        statuses.append(response.status_code)
+
+    assert statuses == [401] * 5 + [429]
+    assert "Retry-After" in response.headers
@@ -0,0 +1,49 @@
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+from app.services.create_docx import render_xlsx
+
+header = ["TITLE", "VALUE", "UNIT", "SOURCE", "COMMENT"]
+
+
+def test_xlsx_description_rows_are_merged_and_tall():
+    sheets = [
+        {
+            "title": "Component",
+            "blocks": [
+                {
+                    "title": "Parameters Scope: a",
+                    "description": "First description",
+                    "rows": [header, ["Length", 1.5, "m", "", ""]],
+                },
+                {
+                    "title": "Parameters Scope: b",
+                    "description": "Second description",
+                    "rows": [header],
+                },
+            ],
+        },
+        {"title": "Without documents", "blocks": []},
+    ]
+
+    workbook = load_workbook(BytesIO(render_xlsx(sheets)))
+
+    assert workbook.sheetnames == ["Component"]
+    worksheet = workbook["Component"]
+    assert worksheet["A3"].value == "First description"
+    assert worksheet["A9"].value == "Second description"
+    assert {str(merged) for merged in worksheet.merged_cells.ranges} == {
+        "A3:E3",
+        "A9:E9",
+    }
+    assert worksheet.row_dimensions[3].height == 60
+    assert worksheet.row_dimensions[9].height == 60
+    assert worksheet.row_dimensions[4].height is None
+    assert worksheet.column_dimensions["A"].width == 30
+
+
+def test_xlsx_without_documents():
+    workbook = load_workbook(BytesIO(render_xlsx([])))
+
+    assert workbook.sheetnames == ["No Components"]
@@ -0,0 +1,32 @@
+from app.services.export_cache import ExportCache
+
+key = "0123456789abcdef" + "0" * 48
+
+
+def make_cache(tmp_path):
+    (tmp_path / "docx").mkdir()
+    cache = ExportCache()
+    cache.init(str(tmp_path), max_bytes=1024)
+    path = tmp_path / "docx" / cache.file_name(key, "project", "docx")
+    path.write_bytes(b"docx")
+    cache.put(key, {"status": "success"}, [str(path)])
+    return cache, path
+
+
+def test_discard_drops_the_entry_and_its_file(tmp_path):
+    cache, path = make_cache(tmp_path)
+
+    cache.discard(key)
+    cache.discard(key)
+
+    assert not path.exists()
+    assert cache.get(key) is None
+    assert cache.metrics()["bytes"] == 0
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache, path = make_cache(tmp_path)
+    path.unlink()
+
+    assert cache.get(key) is None
+    assert cache.metrics()["entries"] == 0
@@ -0,0 +1,27 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import export_jobs as export_jobs_module
+from app.services.export_jobs import ExportJobManager
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_the_cancelled_jobs(monkeypatch):
+    started = asyncio.Event()
+
+    async def export(spec, progress):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setitem(export_jobs_module.exporters, "docx", export)
+    manager = ExportJobManager()
+    spec = SimpleNamespace(project_id=1, document_type="docx", components=[])
+    job = manager.submit(spec, owner_id=1)
+    await started.wait()
+
+    await manager.close()
+
+    assert job.task.done()
+    assert job.state == "cancelled"
@@ -24,3 +24,21 @@ def print_response(response):
     pp.pprint(response.json())
     print('---------------------------------------')
     print()
+
+
+async def get_all_pages(client, url, limit):
+    """Walk a paginated listing page by page, following the X-Next-Cursor
+    header, and return all items and the number of pages."""
+    items = []
+    pages = 0
+    params = {"limit": limit}
+    while True:
+        response = await client.get(url, params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= limit
+        items += response.json()
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return items, pages
+        params = {"limit": limit, "after": cursor}
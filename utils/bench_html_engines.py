@@ -0,0 +1,49 @@
+"""
+Compares the conversion speed of the lxml and html.parser engines on an
+export sized document.
+
+Run from the repository root with: python utils/bench_html_engines.py
+"""
+
+import os
+import sys
+import time
+
+from docx import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app", "html2docx"))
+
+from htmldocx import HtmlToDocx
+from tests.fixtures import component_html
+
+COMPONENTS = 150
+
+
+def convert(engine, html):
+    parser = HtmlToDocx()
+    parser.options["engine"] = engine
+    document = Document()
+    start = time.perf_counter()
+    parser.add_html_to_document(html, document)
+    return time.perf_counter() - start, document
+
+
+def main():
+    html = "".join(component_html(number) for number in range(COMPONENTS))
+    timings = {}
+    documents = {}
+    for engine in ["html.parser", "lxml"]:
+        runs = [convert(engine, html) for _ in range(3)]
+        timings[engine] = min(duration for duration, _ in runs)
+        documents[engine] = runs[0][1]
+        print("%-12s %.2fs" % (engine, timings[engine]))
+    print("speedup      %.1fx" % (timings["html.parser"] / timings["lxml"]))
+    same = all(
+        len(getattr(documents["lxml"], part)) == len(getattr(documents["html.parser"], part))
+        for part in ["paragraphs", "tables"]
+    )
+    print("same number of paragraphs and tables: %s" % same)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Measures the latency of an unrelated endpoint while many logins run at once.
+
+Start the server, e.g. with uvicorn run:server, then run
+
+    python utils/bench_login_storm.py --email user@example.com --password secret
+
+The latency of --path is measured on its own first and then during a storm of
+--logins concurrent logins. Failed logins of a username are throttled, so use
+the password of an existing user. Every login counts towards the limit of the
+client address, login_max_address_attempts, so keep --logins below it or
+raise it in the config.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from httpx import AsyncClient
+
+
+async def login(client: AsyncClient, email: str, password: str) -> int:
+    response = await client.post(
+        "/auth/token", data={"username": email, "password": password}
+    )
+    return response.status_code
+
+
+async def measure(client: AsyncClient, path: str, headers: dict, stop: asyncio.Event):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+def summary(latencies: list[float]) -> str:
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return (
+        f"{len(latencies)} requests, p50 {percentiles[49] * 1000:.1f} ms, "
+        f"p99 {percentiles[98] * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms"
+    )
+
+
+async def main(args):
+    async with AsyncClient(base_url=args.base_url, timeout=120) as client:
+        response = await client.post(
+            "/auth/token", data={"username": args.email, "password": args.password}
+        )
+        response.raise_for_status()
+        token = response.json().get("accessToken") or response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        stop = asyncio.Event()
+        measuring = asyncio.create_task(measure(client, args.path, headers, stop))
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        print("idle:  ", summary(await measuring))
+
+        stop = asyncio.Event()
+        measuring = asyncio.create_task(measure(client, args.path, headers, stop))
+        start = time.perf_counter()
+        statuses = await asyncio.gather(
+            *(login(client, args.email, args.password) for _ in range(args.logins))
+        )
+        storm_seconds = time.perf_counter() - start
+        stop.set()
+        print("storm: ", summary(await measuring))
+        print(
+            f"{args.logins} logins in {storm_seconds:.1f} s, statuses",
+            {status: statuses.count(status) for status in sorted(set(statuses))},
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", default="/roles")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=3)
+    asyncio.run(main(parser.parse_args()))